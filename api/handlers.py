@@ -1,69 +1,247 @@
-from typing import Optional
-from sqlmodel import Session, select, func
-from sqlalchemy import text
-import pandas as pd
-import numpy
+from typing import Optional, TYPE_CHECKING
+import os
+import tempfile
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text, insert, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import orjson
 from models import *
-from utils import logger, model_to_dict, model_list_to_dict_list
+from utils import logger, model_to_dict
+from cache import author_cache, book_cache
+from constants import BOOK_SEARCH_DEFAULT_LIMIT
+from exporter import (INVENTORY_GROUP_COMMIT_WINDOW_MS, INVENTORY_GROUP_COMMIT_MAX_BATCH, BULK_JOB_DIR, BULK_JOB_WORKERS,
+                      BULK_JOB_RANGE_BYTES, BULK_JOB_CONCURRENCY)
+from bulk_jobs import BulkJobRunner, bulk_job_to_dict
 from errors import ValidityError, EntityNotFoundError, DatabaseOperationError
+from database.daily_balance import apply_daily_movements
+from database.group_commit import GroupCommitQueue
+from database.stock_balance import apply_stock_movements, reserve_stock
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def add_item_to_database(session: Session, item) -> dict:
+
+async def add_item_to_database(session: AsyncSession, item) -> dict:
+    """Add an item to the unit of work's transaction and assign its id"""
     try:
-        """Add an item to the database"""
         session.add(item)
-        session.commit()
-        session.refresh(item)
+        await session.flush()
         return item
     except Exception as e:
-        session.rollback()
         logger.exception(f"Error adding item {item} in DB, {e}")
         raise DatabaseOperationError(f"Error adding item {item} in DB, {e}")
-    finally:
-        session.close()
 
 
-def add_author_handler(session: Session, request: Author) -> dict:
+async def insert_inventories(session: AsyncSession, rows: list, update_stock: bool=True) -> None:
+    """
+    Insert inventory movements and update the stock balance and daily rollup of their books,
+    without committing.
+
+    Args:
+        rows (List[Dict]): book_id, quantity and date of every movement.
+        update_stock (bool): False when the stock balance was already updated by reserve_stock.
+    """
+    if not rows:
+        return
+    await session.exec(insert(Inventory), params=rows)
+    await apply_inventory_movements(session, rows, update_stock)
+
+
+async def apply_inventory_movements(session: AsyncSession, rows: list, update_stock: bool=True) -> None:
+    """Update stock_balance and inventory_daily_balance for inserted inventory rows"""
+    movements = {}
+    daily_movements = {}
+    for row in rows:
+        movements[row["book_id"]] = movements.get(row["book_id"], 0) + row["quantity"]
+        key = (row["book_id"], row["date"])
+        daily_movements[key] = daily_movements.get(key, 0) + row["quantity"]
+    if update_stock:
+        await apply_stock_movements(session, movements)
+    await apply_daily_movements(session, daily_movements)
+
+
+async def add_inventory_to_database(session: AsyncSession, inventories: list, update_stock: bool=True) -> list:
+    """Add inventory movements and update the stock balance of their books in the unit of work's transaction"""
+    try:
+        await insert_inventories(session, [inventory.model_dump(exclude={"id"}) for inventory in inventories],
+                                 update_stock)
+        return inventories
+    except Exception as e:
+        logger.exception(f"Error adding inventories in DB, {e}")
+        raise DatabaseOperationError(f"Error adding inventories in DB, {e}")
+
+
+async def add_author_handler(session: AsyncSession, request: Author) -> dict:
     """Add an author to the database"""
     try:
-        item = add_item_to_database(session, request)
+        item = await add_item_to_database(session, request)
         return {"id": item.id}
     except Exception as e:
         raise e
-    finally:
-        session.close()
 
 
-def get_author_by_id_handler(session: Session, author_id: int) -> Optional[Author]:
-    """Retrieve an author from the database by their ID."""
+async def get_author_by_id_handler(session: AsyncSession, author_id: int) -> Optional[dict]:
+    """Retrieve an author from the database by their ID, through author_cache."""
     try:
-        result = session.exec(select(Author).where(Author.id == author_id)).first()
-        if result is None:
+        result = author_cache.get(author_id)
+        if result is not None:
+            return result
+        author = (await session.exec(select(Author).where(Author.id == author_id))).first()
+        if author is None:
             raise EntityNotFoundError(f"No author with ID {author_id} in DB")
+        result = model_to_dict(author)
+        author_cache.set(author_id, result)
         return result
     except EntityNotFoundError as ene:
         raise ene
     except Exception as e:
         logger.exception(f"Error fetching author with ID {author_id} in DB, {e}")
         raise DatabaseOperationError(f"Error fetching author with ID {author_id} in DB, {e}")
-    finally:
-        session.close()
 
 
-def add_book_handler(session: Session, request: Book) -> dict:
+async def add_book_handler(session: AsyncSession, request: Book) -> dict:
     """Add a book to the database"""
     try:
-        item = add_item_to_database(session, request)
+        item = await add_item_to_database(session, request)
+        book_cache.invalidate(item.id)
         return {"id": item.id}
     except Exception as e:
         raise e
-    finally:
-        session.close()
 
 
-def get_book_by_id_handler(session: Session, book_id: int) -> Optional[dict]:
-    """Retrieve book details along with its inventory quantity by book ID."""
+def check_batch_validity(items: list) -> list:
+    """
+    Run check_request_validity on every item of a batch.
+
+    Returns:
+        List[Optional[Dict]]: None for a valid item, {"index", "error"} for an invalid one.
+    """
+    results = []
+    for index, item in enumerate(items):
+        try:
+            item.check_request_validity()
+            results.append(None)
+        except ValidityError as ve:
+            results.append({"index": index, "error": ve.message})
+    return results
+
+
+async def insert_batch_rows(session: AsyncSession, model, items: list, results: list, key_columns: tuple) -> int:
+    """
+    Insert the items that have no result yet with one multi-row insert and fill in their ids.
+
+    Rows conflicting with an existing row or an earlier item of the batch are skipped and
+    reported; key_columns identify the inserted row of an item.
+
+    Returns:
+        int: number of inserted rows.
+    """
+    pending = {}
+    for index, item in enumerate(items):
+        if results[index] is not None:
+            continue
+        key = tuple(getattr(item, column) for column in key_columns)
+        if key in pending:
+            results[index] = {"index": index, "error": f"Duplicate of item {pending[key]} in the batch"}
+            continue
+        pending[key] = index
+    if not pending:
+        return 0
+
+    statement = (
+        pg_insert(model)
+        .values([items[index].model_dump(exclude={"id"}) for index in pending.values()])
+        .on_conflict_do_nothing()
+        .returning(model.id, *(getattr(model, column) for column in key_columns))
+    )
+    inserted = {tuple(row[1:]): row[0] for row in (await session.exec(statement)).all()}
+    for key, index in pending.items():
+        if key in inserted:
+            results[index] = {"index": index, "id": inserted[key]}
+        else:
+            results[index] = {"index": index, "error": f"{model.__name__} conflicts with an existing one"}
+    return len(inserted)
+
+
+async def add_authors_handler(session: AsyncSession, requests: list) -> list:
+    """Add a batch of authors with one multi-row insert, returning an id or an error per author"""
+    try:
+        results = check_batch_validity(requests)
+        await insert_batch_rows(session, Author, requests, results, ("name", "birth_date"))
+        return results
+    except Exception as e:
+        logger.exception(f"Error adding {len(requests)} authors in DB, {e}")
+        raise DatabaseOperationError(f"Error adding {len(requests)} authors in DB, {e}")
+
+
+async def add_books_handler(session: AsyncSession, requests: list) -> list:
+    """Add a batch of books with one multi-row insert, returning an id or an error per book"""
     try:
+        results = check_batch_validity(requests)
+        author_ids = {request.author for index, request in enumerate(requests) if results[index] is None}
+        known_authors = set((await session.exec(select(Author.id).where(Author.id.in_(author_ids)))).all())
+        for index, request in enumerate(requests):
+            if results[index] is None and request.author not in known_authors:
+                results[index] = {"index": index, "error": f"No author with ID {request.author} in DB"}
+        await insert_batch_rows(session, Book, requests, results, ("barcode",))
+        for result in results:
+            if "id" in result:
+                book_cache.invalidate(result["id"])
+        return results
+    except Exception as e:
+        logger.exception(f"Error adding {len(requests)} books in DB, {e}")
+        raise DatabaseOperationError(f"Error adding {len(requests)} books in DB, {e}")
+
+
+async def add_inventories_handler(session: AsyncSession, requests: list) -> list:
+    """
+    Add a batch of /leftover/add movements with one multi-row insert, returning the inventory
+    id or an error per item. Quantities are positive, as for /leftover/add, so no stock check
+    is needed; the balances of the batch's books are updated once, in book id order.
+    """
+    try:
+        results = check_batch_validity(requests)
+        barcodes = {request.barcode for index, request in enumerate(requests) if results[index] is None}
+        books = dict((await session.exec(select(Book.barcode, Book.id).where(Book.barcode.in_(barcodes)))).all())
+        pending = []
+        for index, request in enumerate(requests):
+            if results[index] is None and request.barcode not in books:
+                results[index] = {"index": index, "error": f"Empty book found with {request.barcode} in DB"}
+            elif results[index] is None:
+                pending.append(index)
+        if not pending:
+            return results
+
+        today = date.today()
+        rows = [{"book_id": books[requests[index].barcode], "quantity": requests[index].quantity, "date": today}
+                for index in pending]
+        statement = insert(Inventory).returning(Inventory.id, sort_by_parameter_order=True)
+        inventory_ids = (await session.exec(statement, params=rows)).scalars().all()
+        await apply_inventory_movements(session, rows)
+        for index, inventory_id in zip(pending, inventory_ids):
+            results[index] = {"index": index, "id": inventory_id, "barcode": requests[index].barcode,
+                              "quantity": requests[index].quantity}
+        return results
+    except Exception as e:
+        logger.exception(f"Error adding {len(requests)} inventories in DB, {e}")
+        raise DatabaseOperationError(f"Error adding {len(requests)} inventories in DB, {e}")
+
+
+async def get_book_by_id_handler(session: AsyncSession, book_id: int) -> Optional[dict]:
+    """
+    Retrieve book details along with its inventory quantity by book ID.
+
+    Book metadata is served from book_cache when present; the quantity is always read from
+    stock_balance, so inventory writes never leave a stale quantity in the cache.
+    """
+    try:
+        metadata = book_cache.get(book_id)
+        if metadata is not None:
+            statement = select(StockBalance.quantity).where(StockBalance.book_id == book_id)
+            quantity = (await session.exec(statement)).first()
+            return {**metadata, "quantity": quantity or 0}
         statement = (
             select(
                 Book.id,
@@ -71,13 +249,12 @@ def get_book_by_id_handler(session: Session, book_id: int) -> Optional[dict]:
                 Book.publish_year,
                 Book.author,
                 Book.barcode,
-                func.sum(Inventory.quantity).label("quantity")
+                StockBalance.quantity
             )
-            .join(Inventory, Book.id == Inventory.book_id, isouter=True)
+            .join(StockBalance, Book.id == StockBalance.book_id, isouter=True)
             .where(Book.id == book_id)
-            .group_by(Book.id)
         )
-        result = session.exec(statement).first()
+        result = (await session.exec(statement)).first()
         if result is None:
             raise EntityNotFoundError(f"No book with ID {book_id} in DB")
         data = {
@@ -88,6 +265,7 @@ def get_book_by_id_handler(session: Session, book_id: int) -> Optional[dict]:
                 "publish_year": result.publish_year,
                 "quantity": 0
         }
+        book_cache.set(book_id, {key: value for key, value in data.items() if key != "quantity"})
         if result.quantity is not None:
             data["quantity"] = result.quantity
         return data
@@ -96,37 +274,95 @@ def get_book_by_id_handler(session: Session, book_id: int) -> Optional[dict]:
     except Exception as e:
         logger.exception(f"Error fetching book with ID {book_id} in DB, {e}")
         raise DatabaseOperationError(f"Error fetching book with ID {book_id} in DB, {e}")
-    finally:
-        session.close()
 
 
-def get_book_by_barcode_handler(session: Session, barcode: str) -> Optional[Book]:
-    """Retrieve book details based on the provided barcode."""
+async def get_books_handler(session: AsyncSession, keys: list, by_barcode: bool=False) -> dict:
+    """
+    Retrieve many books with their inventory quantity by id, or by exact barcode, in one query.
+
+    The keys are sent as a single array parameter matched with = ANY(...), so every call
+    reuses one prepared statement whatever the number of keys. Books come back in the
+    requested order and keys without a book are listed in "missing".
+    """
     try:
+        keys = list(dict.fromkeys(keys))
+        column = Book.barcode if by_barcode else Book.id
         statement = (
             select(
                 Book.id,
                 Book.title,
                 Book.publish_year,
-                Author.name,
-                Author.birth_date,
+                Book.author,
                 Book.barcode,
-                func.sum(Inventory.quantity).label("quantity")
+                StockBalance.quantity
             )
-            .join(Author, Book.author == Author.id)
-            .join(Inventory, Book.id == Inventory.book_id, isouter=True)
-            .where(Book.barcode.like(f"{barcode}%"))
-            .group_by(
+            .join(StockBalance, Book.id == StockBalance.book_id, isouter=True)
+            .where(column == any_(bindparam("keys", type_=ARRAY(column.type))))
+        )
+        found = {}
+        for result in (await session.exec(statement, params={"keys": keys})).all():
+            data = {
+                "id": result.id,
+                "title": result.title,
+                "barcode": result.barcode,
+                "author": result.author,
+                "publish_year": result.publish_year
+            }
+            book_cache.set(result.id, data)
+            found[result.barcode if by_barcode else result.id] = {**data, "quantity": result.quantity or 0}
+        return {
+            "found": len(found),
+            "items": [found[key] for key in keys if key in found],
+            "missing": [key for key in keys if key not in found]
+        }
+    except Exception as e:
+        logger.exception(f"Error fetching {len(keys)} books in DB, {e}")
+        raise DatabaseOperationError(f"Error fetching {len(keys)} books in DB, {e}")
+
+
+def barcode_prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string above every string starting with prefix in "C" collation order"""
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+async def get_book_by_barcode_handler(session: AsyncSession, barcode: str,
+                                      limit: int=BOOK_SEARCH_DEFAULT_LIMIT,
+                                      after_barcode: Optional[str]=None) -> Optional[Book]:
+    """
+    Retrieve book details based on the provided barcode prefix, one page at a time.
+
+    The prefix match is written as a range over barcode in "C" collation so that it is
+    answered by idx_barcode_pattern; pages continue after the last barcode of the previous one.
+    """
+    try:
+        barcode_c = Book.barcode.collate("C")
+        statement = (
+            select(
                 Book.id,
                 Book.title,
                 Book.publish_year,
                 Author.name,
                 Author.birth_date,
-                Book.barcode
+                Book.barcode,
+                StockBalance.quantity
             )
-            .order_by(Book.barcode.asc())
+            .join(Author, Book.author == Author.id)
+            .join(StockBalance, Book.id == StockBalance.book_id, isouter=True)
+            .where(barcode_c >= barcode)
+            .order_by(barcode_c.asc())
+            .limit(limit)
         )
-        results = session.exec(statement)
+        upper_bound = barcode_prefix_upper_bound(barcode)
+        if upper_bound is not None:
+            statement = statement.where(barcode_c < upper_bound)
+        if after_barcode is not None:
+            statement = statement.where(barcode_c > after_barcode)
+        results = await session.exec(statement)
         data_list = []
         for result in results.all():
             data = {
@@ -145,96 +381,328 @@ def get_book_by_barcode_handler(session: Session, barcode: str) -> Optional[Book
             data_list.append(data)
         return {
             "found": len(data_list),
-            "items": data_list
+            "items": data_list,
+            "next_after_barcode": data_list[-1]["barcode"] if len(data_list) == limit else None
         }
     except Exception as e:
         logger.exception(f"Error fetching book with bracode {barcode} in DB, {e}")
         raise DatabaseOperationError(f"Error fetching book with bracode {barcode} in DB, {e}")
-    finally:
-        session.close()
 
 
-def add_inventory_handler(session: Session, request: InventoryRequest) -> dict:
-    """Add an inventory to the database"""
+async def add_inventory_handler(session: AsyncSession, request: InventoryRequest) -> dict:
+    """
+    Add an inventory to the database.
+
+    Removals are checked and taken off the stock balance by one conditional update
+    (reserve_stock), so concurrent sales of the same book can't oversell it. When group
+    commit is enabled the movement is written by inventory_queue instead, in a transaction
+    shared with the other movements of its window.
+    """
+    if inventory_queue.running:
+        return await inventory_queue.submit(request)
     try:
-        book = session.exec(select(Book).where(Book.barcode == request.barcode)).first()
-        book_quantity_data = get_book_by_id_handler(session, book.id)
-        if book_quantity_data["quantity"] + request.quantity < 0:
-            logger.exception(f"No enough book barcode {request.barcode} inventory in DB")
-            raise ValueError(f"No enough book barcode {request.barcode} inventory in DB")
-        if book:
-            inventory = add_item_to_database(session,
-                                             Inventory(book_id=book.id,
-                                                       quantity=request.quantity,
-                                                       date=datetime.now().strftime("%Y-%m-%d")))
-            return {"barcode": request.barcode, "quantity": inventory.quantity}
-        else:
+        book_id = (await session.exec(select(Book.id).where(Book.barcode == request.barcode))).first()
+        if book_id is None:
             logger.exception(f"Empty book found with {request.barcode} in DB")
             raise ValueError(f"Empty book found with {request.barcode} in DB")
+        inventory = Inventory(book_id=book_id, quantity=request.quantity, date=date.today())
+        if request.quantity < 0:
+            if await reserve_stock(session, book_id, -request.quantity) is None:
+                logger.exception(f"No enough book barcode {request.barcode} inventory in DB")
+                raise ValueError(f"No enough book barcode {request.barcode} inventory in DB")
+            await add_inventory_to_database(session, [inventory], update_stock=False)
+        else:
+            await add_inventory_to_database(session, [inventory])
+        return {"barcode": request.barcode, "quantity": inventory.quantity}
     except Exception as e:
             logger.exception(f"Error adding an inventory, {e}")
             raise e
-    finally:
-        session.close()
+
+
+async def add_inventory_batch_handler(session: AsyncSession, requests: list) -> list:
+    """
+    Write the movements of several /leftover/add and /leftover/remove calls in one transaction.
+
+    The balances of the batch's books are locked in book id order, then the requests are
+    checked in arrival order against the running balance, so a removal fails exactly when it
+    would have failed on its own. Accepted movements are written with one multi-row insert.
+
+    Returns:
+        List: for every request, its result or the exception it failed with.
+    """
+    barcodes = {request.barcode for request in requests}
+    books = dict((await session.exec(select(Book.barcode, Book.id).where(Book.barcode.in_(barcodes)))).all())
+    statement = (
+        select(StockBalance.book_id, StockBalance.quantity)
+        .where(StockBalance.book_id.in_(set(books.values())))
+        .order_by(StockBalance.book_id)
+        .with_for_update()
+    )
+    balances = dict((await session.exec(statement)).all())
+
+    today = date.today()
+    results = []
+    rows = []
+    for request in requests:
+        book_id = books.get(request.barcode)
+        if book_id is None:
+            results.append(ValueError(f"Empty book found with {request.barcode} in DB"))
+            continue
+        balance = balances.get(book_id, 0)
+        if request.quantity < 0 and balance + request.quantity < 0:
+            results.append(ValueError(f"No enough book barcode {request.barcode} inventory in DB"))
+            continue
+        balances[book_id] = balance + request.quantity
+        rows.append({"book_id": book_id, "quantity": request.quantity, "date": today})
+        results.append({"barcode": request.barcode, "quantity": request.quantity})
+    await insert_inventories(session, rows)
+    return results
+
+
+# Started by main.lifespan when INVENTORY_GROUP_COMMIT_WINDOW_MS is set
+inventory_queue = GroupCommitQueue(add_inventory_batch_handler, INVENTORY_GROUP_COMMIT_WINDOW_MS / 1000,
+                                   INVENTORY_GROUP_COMMIT_MAX_BATCH)
 
 
 from sqlalchemy.exc import IntegrityError
 
-def add_inventory_bulk_handler(session: Session, request: pd.core.frame.DataFrame) -> list:
-    """Add inventory items in bulk based on the provided request."""
-    updated_items = []
-    try:
-        for index, row in request.iterrows():
-            barcode = row.iloc[0]
-            quantity = row.iloc[1]
-            if pd.isna(barcode):
-                logger.info(f"Empty barcode found in row {index} for DB, skipping...")
-                continue
-            elif pd.isna(quantity):
-                logger.error(f"barcode {str(int(barcode))} has no quantity for DB, stopping...")
-                raise EntityNotFoundError(f"barcode {str(int(barcode))} has no quantity for DB")
-            elif not isinstance(quantity, (numpy.int64, numpy.float64, int)):
-                logger.error(f"barcode {str(int(barcode))} quantity is not a number {quantity} in row {index} for DB stopping...")
-                raise ValidityError(f"barcode {str(int(barcode))} quantity is not a number {quantity} in row {index} for DB")
-            
-            # Fetch book data outside the loop
-            barcode_int = int(barcode)
-            book = session.query(Book).filter_by(barcode=str(barcode_int)).first()
-            if book:
-                inventory = Inventory(book_id=book.id, quantity=int(quantity), date=datetime.now().strftime("%Y-%m-%d"))
-                updated_items.append(inventory)  # Append the instance, not a dictionary
-            else:
-                logger.error(f"Empty book found with {str(barcode_int)} in DB")
-                raise ValueError(f"Empty book found with {str(barcode_int)} in DB")
-                
-        # Batch insert updated items
-        session.bulk_save_objects(updated_items)
-        session.commit()
-        
-    finally:
-        session.close()
-    
-    return model_list_to_dict_list(updated_items)
-
-
-
-from sqlalchemy import text
-
-def get_book_history_handler(session: Session, request: InventoryHistoryRequest) -> list:
+
+def validate_inventory_batch(batch: list) -> "pd.DataFrame":
     """
-    Retrieves the inventory history of books based on the provided request parameters.
+    Validate the quantities of a batch of (row index, barcode, quantity) over the whole column.
+
+    Returns:
+        pd.DataFrame: Rows with a barcode, indexed by row index, with the barcode as a string
+        and an "error" column set to "no_quantity" or "not_number" for invalid rows.
+    """
+    # pandas and numpy are only imported by the first bulk upload
+    import numpy
+    import pandas as pd
+
+    frame = pd.DataFrame(batch, columns=["row", "barcode", "quantity"]).set_index("row")
+    empty_barcode = frame["barcode"].isna()
+    for index in frame.index[empty_barcode]:
+        logger.info(f"Empty barcode found in row {index} for DB, skipping...")
+    frame = frame[~empty_barcode]
+
+    frame["barcode"] = frame["barcode"].astype("int64").astype(str)
+    no_quantity = frame["quantity"].isna()
+    if pd.api.types.is_numeric_dtype(frame["quantity"]):
+        not_number = pd.Series(False, index=frame.index)
+    else:
+        number_types = [int, float, numpy.int64, numpy.float64]
+        not_number = ~frame["quantity"].map(type).isin(number_types) & ~no_quantity
+    frame["error"] = None
+    frame.loc[not_number, "error"] = "not_number"
+    frame.loc[no_quantity, "error"] = "no_quantity"
+    return frame
+
+
+def raise_inventory_row_error(index, barcode: str, quantity, error: str):
+    """Raise the error of an invalid bulk upload row"""
+    if error == "no_quantity":
+        logger.error(f"barcode {barcode} has no quantity for DB, stopping...")
+        raise EntityNotFoundError(f"barcode {barcode} has no quantity for DB")
+    elif error == "not_number":
+        logger.error(f"barcode {barcode} quantity is not a number {quantity} in row {index} for DB stopping...")
+        raise ValidityError(f"barcode {barcode} quantity is not a number {quantity} in row {index} for DB")
+    logger.error(f"Empty book found with {barcode} in row {index} in DB")
+    raise ValueError(f"Empty book found with {barcode} in row {index} in DB")
+
+
+async def resolve_inventory_batch(session: AsyncSession, batch: list, known_books: dict, today: date) -> list:
+    """
+    Validate a batch of (row index, barcode, quantity) and resolve its barcodes to book ids.
+
+    Unseen barcodes are resolved with a single IN lookup. The first failing row is reported,
+    as a row by row scan would.
+
+    Args:
+        known_books (Dict[str, int]): barcode -> book id cache shared by the batches of one upload.
+
+    Returns:
+        List[Dict]: book_id, quantity and date for every row with a barcode.
+    """
+    import pandas as pd
+
+    frame = validate_inventory_batch(batch)
+    if frame.empty:
+        return []
+
+    unknown = [barcode for barcode in frame["barcode"].unique() if barcode not in known_books]
+    if unknown:
+        statement = select(Book.barcode, Book.id).where(Book.barcode.in_(unknown))
+        known_books.update((await session.exec(statement)).all())
+    book_ids = frame["barcode"].map(known_books)
+    frame.loc[book_ids.isna() & frame["error"].isna(), "error"] = "no_book"
+
+    failed = frame["error"].notna()
+    if failed.any():
+        index = failed.idxmax()
+        raise_inventory_row_error(index, *frame.loc[index, ["barcode", "quantity", "error"]])
+
+    return pd.DataFrame({
+        "book_id": book_ids.astype("int64"),
+        "quantity": frame["quantity"].astype("int64"),
+        "date": today
+    }).to_dict("records")
+
+
+def inventory_upload_summary(books: dict) -> dict:
+    """
+    The result of a bulk upload, which grows with the books it touched, not with its rows.
+
+    Args:
+        books (Dict[int, List]): book id -> [barcode, rows, net quantity].
+
+    Returns:
+        Dict: "rows" written, and "books" with the rows and net quantity of each book, by book id.
+    """
+    return {
+        "rows": sum(rows for _, rows, _ in books.values()),
+        "books": [{"book_id": book_id, "barcode": barcode, "rows": rows, "quantity": quantity}
+                  for book_id, (barcode, rows, quantity) in sorted(books.items())]
+    }
+
+
+async def add_inventory_bulk_handler(session: AsyncSession, request) -> dict:
     """
+    Add inventory items in bulk based on the provided request.
 
-    query = """
+    Batches of (row index, barcode, quantity) are validated and their inventory rows written
+    with multi-row inserts as they arrive. The stock balance and daily rollup of the upload's
+    books are updated once, in book id order, after the last batch, like
+    add_inventory_copy_handler does: their row locks are only held from there to the commit,
+    so uploads of overlapping books can't deadlock on them and single movements are not
+    blocked while the file is read. Only per-book totals are kept, so memory does not grow
+    with the number of rows.
+    """
+    books = {}
+    known_books = {}
+    today = date.today()
+    async for batch in request:
+        rows = await resolve_inventory_batch(session, batch, known_books, today)
+        if rows:
+            await session.exec(insert(Inventory), params=rows)
+        for row in rows:
+            totals = books.setdefault(row["book_id"], [None, 0, 0])
+            totals[1] += 1
+            totals[2] += row["quantity"]
+    # Every row is dated today, so the per-book totals are the per-(book, day) totals too
+    await apply_stock_movements(session, {book_id: totals[2] for book_id, totals in books.items()})
+    await apply_daily_movements(session, {(book_id, today): totals[2] for book_id, totals in books.items()})
+    barcodes = {book_id: barcode for barcode, book_id in known_books.items()}
+    for book_id, totals in books.items():
+        totals[0] = barcodes[book_id]
+    return inventory_upload_summary(books)
+
+
+async def add_inventory_copy_handler(session: AsyncSession, request) -> dict:
+    """
+    Add inventory items in bulk through PostgreSQL COPY.
+
+    Validated rows are streamed into a temporary staging table with COPY FROM STDIN, then
+    barcodes are resolved and the rows are merged into inventory by one statement before the
+    stock balance and daily rollup of their books are updated from per-book totals summed in
+    the database, so no row comes back to Python. Everything runs in the unit of work's
+    transaction, so the upload stays all-or-nothing and reports the same first failing row as
+    add_inventory_bulk_handler.
+    """
+    today = date.today()
+    await session.exec(text("""
+    CREATE TEMPORARY TABLE inventory_staging (
+        row_index BIGINT NOT NULL,
+        barcode TEXT NOT NULL,
+        quantity BIGINT NOT NULL
+    ) ON COMMIT DROP
+    """))
+    raw_connection = await (await session.connection()).get_raw_connection()
+    copy_connection = raw_connection.driver_connection
+
+    invalid_row = None
+    async for batch in request:
+        frame = validate_inventory_batch(batch)
+        failed = frame["error"].notna()
+        if failed.any():
+            invalid_row = failed.idxmax()
+            invalid = frame.loc[invalid_row]
+            frame = frame[frame.index < invalid_row]
+        if not frame.empty:
+            records = zip(frame.index.tolist(), frame["barcode"].tolist(),
+                          frame["quantity"].astype("int64").tolist())
+            await copy_connection.copy_records_to_table("inventory_staging", records=records,
+                                                        columns=["row_index", "barcode", "quantity"])
+        if invalid_row is not None:
+            break
+
+    # A row with an unknown barcode before the first invalid quantity fails first
+    unknown = (await session.exec(text("""
+    SELECT s.row_index, s.barcode
+    FROM inventory_staging s
+    LEFT JOIN book b ON b.barcode = s.barcode
+    WHERE b.id IS NULL
+    ORDER BY s.row_index
+    LIMIT 1
+    """))).first()
+    if unknown is not None:
+        raise_inventory_row_error(unknown.row_index, unknown.barcode, None, "no_book")
+    if invalid_row is not None:
+        raise_inventory_row_error(invalid_row, invalid.barcode, invalid.quantity, invalid.error)
+
+    await session.exec(text("""
+    INSERT INTO inventory (book_id, quantity, date)
+    SELECT b.id, s.quantity, CAST(:today AS DATE)
+    FROM inventory_staging s
+    JOIN book b ON b.barcode = s.barcode
+    ORDER BY s.row_index
+    """), params={"today": today})
+    # The balances only need one total per book, summed where the rows are
+    totals = (await session.exec(text("""
+    SELECT b.id, b.barcode, COUNT(*) AS rows, CAST(SUM(s.quantity) AS BIGINT) AS quantity
+    FROM inventory_staging s
+    JOIN book b ON b.barcode = s.barcode
+    GROUP BY b.id, b.barcode
+    """))).all()
+    await apply_stock_movements(session, {row.id: row.quantity for row in totals})
+    await apply_daily_movements(session, {(row.id, today): row.quantity for row in totals})
+
+    return inventory_upload_summary({row.id: [row.barcode, row.rows, row.quantity] for row in totals})
+
+
+# Started by main.lifespan
+bulk_jobs = BulkJobRunner(BULK_JOB_DIR or os.path.join(tempfile.gettempdir(), "bookshop-bulk-jobs"),
+                          BULK_JOB_WORKERS or os.cpu_count(), BULK_JOB_RANGE_BYTES, BULK_JOB_CONCURRENCY)
+
+
+async def get_bulk_job_handler(session: AsyncSession, job_id: str) -> dict:
+    """Retrieve the status of a bulk import job by its ID."""
+    job = (await session.exec(select(BulkJob).where(BulkJob.id == job_id))).first()
+    if job is None:
+        raise EntityNotFoundError(f"No bulk job with ID {job_id} in DB")
+    return bulk_job_to_dict(job)
+
+
+BOOK_HISTORY_QUERY = """
     SELECT
         b.id AS book_key,
         b.title AS book_title,
         b.barcode AS book_barcode,
-        COALESCE(start_balance, 0) AS start_balance,
-        COALESCE(end_balance, 0) AS end_balance,
-        CASE
-            WHEN COUNT(i.date) = 0 THEN '[]'
-            ELSE
+        COALESCE((
+            SELECT d.closing_balance
+            FROM inventory_daily_balance d
+            WHERE d.book_id = b.id AND d.day < :start_date
+            ORDER BY d.day DESC
+            LIMIT 1
+        ), 0) AS start_balance,
+        COALESCE((
+            SELECT d.closing_balance
+            FROM inventory_daily_balance d
+            WHERE d.book_id = b.id AND d.day <= :end_date
+            ORDER BY d.day DESC
+            LIMIT 1
+        ), 0) AS end_balance,
+        CAST(COALESCE((
+            SELECT
                 JSON_AGG(
                     JSON_BUILD_OBJECT(
                         'date', i.date,
@@ -243,59 +711,108 @@ def get_book_history_handler(session: Session, request: InventoryHistoryRequest)
                             WHEN i.quantity > 0 THEN CONCAT('+', CAST(i.quantity AS text))
                             ELSE CAST(i.quantity AS text)
                         END
-                    ) ORDER BY i.date DESC
+                    ) ORDER BY i.date DESC, i.id DESC
                 )
-        END AS history
+            FROM inventory i
+            WHERE i.book_id = b.id AND i.date BETWEEN :start_date AND :end_date
+        ), '[]') AS TEXT) AS history
     FROM
         book b
-    LEFT JOIN (
-        SELECT
-            book_id,
-            SUM(CASE WHEN date < :start_date THEN quantity ELSE 0 END) AS start_balance,
-            SUM(CASE WHEN date <= :end_date THEN quantity ELSE 0 END) AS end_balance
-        FROM
-            inventory
-        WHERE
-            date BETWEEN :start_date AND :end_date
-        GROUP BY
-            book_id
-    ) balances ON b.id = balances.book_id
-    LEFT JOIN
-        inventory i ON b.id = i.book_id AND i.date BETWEEN :start_date AND :end_date
     WHERE
-        (:book_id IS NULL OR b.id = :book_id)
-    GROUP BY
-        b.id, b.title, b.barcode, start_balance, end_balance;
+        (CAST(:book_id AS INTEGER) IS NULL OR b.id = :book_id)
+        AND (CAST(:after_book AS INTEGER) IS NULL OR b.id > :after_book)
+    ORDER BY
+        b.id
+    LIMIT CAST(:limit AS INTEGER);
     """
 
-    try:
-        parameters = {
-            "start_date": request.start,
-            "end_date": request.end,
-            "book_id": request.book if request.book else None
-        }
 
-        with session.connection().engine.connect() as connection:
-            result = connection.execute(text(query), parameters)
-            inventory_history = []
-            for row in result.fetchall():
-                data = {
-                    "book": {
-                        "key": row.book_key,
-                        "title": row.book_title,
-                        "barcode": row.book_barcode
-                    },
-                    "start_balance": row.start_balance,
-                    "end_balance": row.end_balance,
-                    "history": row.history
-                }
-                inventory_history.append(data)
-
-        return inventory_history
+def get_book_history_parameters(request: InventoryHistoryRequest, limit: Optional[int]) -> dict:
+    return {
+        "start_date": datetime.strptime(request.start, "%Y-%m-%d").date(),
+        "end_date": datetime.strptime(request.end, "%Y-%m-%d").date(),
+        "book_id": int(request.book) if request.book else None,
+        "after_book": request.after_book,
+        "limit": limit
+    }
+
 
+def book_history_row_to_dict(row) -> dict:
+    return {
+        "book": {
+            "key": row.book_key,
+            "title": row.book_title,
+            "barcode": row.book_barcode
+        },
+        "start_balance": row.start_balance,
+        "end_balance": row.end_balance,
+        # Already JSON text from Postgres, embedded in the response without decoding
+        "history": orjson.Fragment(row.history)
+    }
+
+
+async def get_book_history_handler(session: AsyncSession, request: InventoryHistoryRequest) -> list:
+    """
+    Retrieves the inventory history of books based on the provided request parameters.
+
+    Books are returned in key order after request.after_book, at most request.limit of them,
+    every book when it is None. Start and end balances come from the inventory_daily_balance
+    rollup and only movements inside the window are read.
+    """
+    try:
+        parameters = get_book_history_parameters(request, request.limit)
+        result = await session.exec(text(BOOK_HISTORY_QUERY), params=parameters)
+        return [book_history_row_to_dict(row) for row in result.fetchall()]
     except Exception as e:
         logger.exception(f"Error getting inventory history in DB, {e}")
         raise DatabaseOperationError(f"Error getting inventory history in DB, {e}")
-    finally:
-        session.close()
 
+
+async def get_book_history_page_handler(session: AsyncSession, request: InventoryHistoryRequest) -> dict:
+    """
+    One page of get_book_history_handler; a full page carries the key of its last book as the
+    cursor of the next one.
+    """
+    data_list = await get_book_history_handler(session, request)
+    return {
+        "found": len(data_list),
+        "items": data_list,
+        "next_after_book": data_list[-1]["book"]["key"] if len(data_list) == request.limit else None
+    }
+
+
+async def stream_book_history_handler(session: AsyncSession, request: InventoryHistoryRequest):
+    """
+    Start streaming the inventory history of every book after request.after_book.
+
+    Rows are read through a server-side cursor on a session of its own, since the response is
+    streamed after the request's session has been released. The parameters are parsed and the
+    first book is fetched before returning, so they fail the request with a status code rather
+    than a truncated 200 body.
+
+    Returns:
+        AsyncIterator[Dict]: the books, one at a time.
+    """
+    parameters = get_book_history_parameters(request, None)
+    stream_session = AsyncSession(session.bind)
+    try:
+        result = await stream_session.stream(text(BOOK_HISTORY_QUERY), parameters)
+        first = await anext(result, None)
+    except Exception as e:
+        await stream_session.close()
+        logger.exception(f"Error streaming inventory history in DB, {e}")
+        raise DatabaseOperationError(f"Error streaming inventory history in DB, {e}")
+
+    async def books():
+        try:
+            if first is None:
+                return
+            yield book_history_row_to_dict(first)
+            async for row in result:
+                yield book_history_row_to_dict(row)
+        except Exception as e:
+            logger.exception(f"Error streaming inventory history in DB, {e}")
+            raise DatabaseOperationError(f"Error streaming inventory history in DB, {e}")
+        finally:
+            await stream_session.close()
+    return books()
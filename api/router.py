@@ -1,31 +1,34 @@
-from io import BytesIO
-import json
+from typing import List
+import logging
 import os
 
-import pandas as pd
-from fastapi import APIRouter, HTTPException, UploadFile, Depends, File, Query 
-from fastapi.responses import JSONResponse
+import orjson
 
-from database.database import get_session
+from fastapi import APIRouter, HTTPException, UploadFile, Depends, File, Query, Body
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from cache import cache_stats
+from constants import BATCH_MAX_ITEMS, BOOK_MULTI_GET_MAX_ITEMS, BOOK_SEARCH_DEFAULT_LIMIT, BOOK_SEARCH_MAX_LIMIT, HISTORY_MAX_LIMIT
+from database.database import get_session, get_read_session, get_bulk_upload_session
 from errors import EntityNotFoundError, ValidityError
+from exporter import BULK_COPY_THRESHOLD_BYTES
 from api.handlers import *
 from models import *
 from responses import Response
-from utils import logger, get_barcode_quantity_datagram_from_bytes
+from log import log_event
+from metrics import render_metrics
+from utils import logger, iter_barcode_quantity_batches, iter_csv_rows, iter_row_batches, iter_xlsx_rows
 
 router = APIRouter()
 
-def post_handler(request, http_status_code, message, handler_func, database_session):
-    request_data = None
+async def post_handler(request, http_status_code, message, handler_func, database_session, route):
     try:
-        result = handler_func(database_session, request)
-        if isinstance(request, (pd.core.frame.DataFrame)):
-            request_data = request.to_json(orient="records")
-        else:
-            request_data = json.dumps(request.model_dump())
-        logger.info(f"/{request.__class__.__name__.lower()} request: {request_data}")
-        logger.info(f"/{request.__class__.__name__.lower()} result: {result}")
-        return JSONResponse(content=Response(result, message), status_code=http_status_code)
+        result = await handler_func(database_session, request)
+        # request and result are only rendered if the record is logged
+        log_event(logger, logging.INFO, "request handled", route=route,
+                  request=request if isinstance(request, (SQLModel, list)) else "<streamed upload>",
+                  result=result)
+        return Response(result, message, http_status_code)
     except ValidityError as v_error:
         raise v_error
     except Exception as e:
@@ -38,11 +41,21 @@ async def root():
     return Response("ping", "ping")
 
 
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return Response(cache_stats(), "Cache statistics loaded successfully")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @router.post("/author")
-async def add_author(request: Author, database_session: Session=Depends(get_session)):
+async def add_author(request: Author, database_session: AsyncSession=Depends(get_session)):
     try:
         request.check_request_validity()
-        return post_handler(request, 201, "Author created successfully", add_author_handler, database_session)
+        return await post_handler(request, 201, "Author created successfully", add_author_handler, database_session, "/author")
     except ValidityError as v_error:
         raise HTTPException(status_code=422, detail=str(v_error))
     except Exception as e:
@@ -50,11 +63,21 @@ async def add_author(request: Author, database_session: Session=Depends(get_sess
         raise HTTPException(status_code=500, detail=f"Error adding author, {e}")
 
 
+@router.post("/author/batch")
+async def add_authors(request: List[Author]=Body(..., min_length=1, max_length=BATCH_MAX_ITEMS),
+                      database_session: AsyncSession=Depends(get_session)):
+    try:
+        return await post_handler(request, 201, "Authors processed successfully", add_authors_handler, database_session, "/author/batch")
+    except Exception as e:
+        logger.exception(f"Error adding authors, {e}")
+        raise HTTPException(status_code=500, detail=f"Error adding authors, {e}")
+
+
 @router.get("/author/{author_id}")
-async def get_author_by_id(author_id: str, database_session: Session=Depends(get_session)):
+async def get_author_by_id(author_id: str, database_session: AsyncSession=Depends(get_read_session)):
     try:
-        result = get_author_by_id_handler(database_session, int(author_id))
-        logger.info(f"author_id: {author_id}, /author result: {result}")
+        result = await get_author_by_id_handler(database_session, int(author_id))
+        log_event(logger, logging.INFO, "author loaded", route="/author/{author_id}", author_id=author_id, result=result)
         return Response(result, "Author loaded successfully")
     except EntityNotFoundError as ne:
         raise HTTPException(status_code=404, detail=f"No author with {author_id}, {ne}")
@@ -64,10 +87,10 @@ async def get_author_by_id(author_id: str, database_session: Session=Depends(get
 
 
 @router.post("/book")
-async def add_book(request: Book, database_session: Session=Depends(get_session)):
+async def add_book(request: Book, database_session: AsyncSession=Depends(get_session)):
     try:
         request.check_request_validity()
-        return post_handler(request, 201, "Book created successfully", add_book_handler, database_session)
+        return await post_handler(request, 201, "Book created successfully", add_book_handler, database_session, "/book")
     except ValidityError as v_error:
         raise HTTPException(status_code=422, detail=str(v_error))
     except Exception as e:
@@ -75,11 +98,21 @@ async def add_book(request: Book, database_session: Session=Depends(get_session)
         raise HTTPException(status_code=500, detail=f"Error adding book, {e}")
 
 
+@router.post("/book/batch")
+async def add_books(request: List[Book]=Body(..., min_length=1, max_length=BATCH_MAX_ITEMS),
+                    database_session: AsyncSession=Depends(get_session)):
+    try:
+        return await post_handler(request, 201, "Books processed successfully", add_books_handler, database_session, "/book/batch")
+    except Exception as e:
+        logger.exception(f"Error adding books, {e}")
+        raise HTTPException(status_code=500, detail=f"Error adding books, {e}")
+
+
 @router.get("/book/{book_id}")
-async def get_book_by_id(book_id: str, database_session: Session=Depends(get_session)):
+async def get_book_by_id(book_id: str, database_session: AsyncSession=Depends(get_read_session)):
     try:
-        result = get_book_by_id_handler(database_session, int(book_id))
-        logger.info(f"book_id: {book_id}, /book result: {result}")
+        result = await get_book_by_id_handler(database_session, int(book_id))
+        log_event(logger, logging.INFO, "book loaded", route="/book/{book_id}", book_id=book_id, result=result)
         return Response(result, "Book loaded successfully")
     except EntityNotFoundError as ne:
         raise HTTPException(status_code=404, detail=f"No book with {book_id}, {ne}")
@@ -88,22 +121,50 @@ async def get_book_by_id(book_id: str, database_session: Session=Depends(get_ses
         raise HTTPException(status_code=500, detail=f"Error fetching book with ID {book_id}, {e}")
 
 
+def split_keys(value: str) -> list:
+    keys = [key.strip() for key in value.split(",") if key.strip()]
+    if not keys or len(keys) > BOOK_MULTI_GET_MAX_ITEMS:
+        raise ValidityError(f"between 1 and {BOOK_MULTI_GET_MAX_ITEMS} comma separated keys are required")
+    return keys
+
+
 @router.get("/book")
-async def get_book_by_barcode(barcode: str, database_session: Session=Depends(get_session)):
+async def get_book_by_barcode(barcode: Optional[str]=None,
+                              limit: int=Query(BOOK_SEARCH_DEFAULT_LIMIT, ge=1, le=BOOK_SEARCH_MAX_LIMIT),
+                              after_barcode: Optional[str]=None,
+                              ids: Optional[str]=None,
+                              barcodes: Optional[str]=None,
+                              database_session: AsyncSession=Depends(get_read_session)):
+    """
+    Search books by barcode prefix (barcode), or get many books by id (ids) or exact
+    barcode (barcodes), both comma separated.
+    """
     try:
-        result = get_book_by_barcode_handler(database_session, barcode)
-        logger.info(f"barcode: {barcode}, /book result: {result}")
+        if [barcode, ids, barcodes].count(None) != 2:
+            raise ValidityError("exactly one of barcode, ids and barcodes is required")
+        if ids is not None:
+            result = await get_books_handler(database_session, [int(key) for key in split_keys(ids)])
+        elif barcodes is not None:
+            result = await get_books_handler(database_session, split_keys(barcodes), by_barcode=True)
+        else:
+            result = await get_book_by_barcode_handler(database_session, barcode, limit, after_barcode)
+        log_event(logger, logging.INFO, "books loaded", route="/book", barcode=barcode, ids=ids, barcodes=barcodes,
+                  found=result["found"])
         return Response(result, "Book loaded successfully")
+    except ValueError as ve:
+        raise HTTPException(status_code=422, detail=f"Invalid book id, {ve}")
+    except ValidityError as v_error:
+        raise HTTPException(status_code=422, detail=str(v_error))
     except Exception as e:
         logger.exception(f"Error fetching book with barcode {barcode}, {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching book with barcode {barcode}, {e}")
 
 
 @router.post("/leftover/add")
-async def add_inventory(request: InventoryRequest, database_session: Session=Depends(get_session)):
+async def add_inventory(request: InventoryRequest, database_session: AsyncSession=Depends(get_session)):
     try:
         request.check_request_validity()
-        return post_handler(request, 201, "Inventory created successfully", add_inventory_handler, database_session)
+        return await post_handler(request, 201, "Inventory created successfully", add_inventory_handler, database_session, "/leftover/add")
     except ValidityError as v_error:
         raise HTTPException(status_code=422, detail=str(v_error))
     except Exception as e:
@@ -112,11 +173,11 @@ async def add_inventory(request: InventoryRequest, database_session: Session=Dep
 
 
 @router.post("/leftover/remove")
-async def remove_inventory(request: InventoryRequest, database_session: Session=Depends(get_session)):
+async def remove_inventory(request: InventoryRequest, database_session: AsyncSession=Depends(get_session)):
     try:
         request.check_request_validity()
         request.quantity = -1 * request.quantity
-        return post_handler(request, 201, "Inventory created successfully", add_inventory_handler, database_session)
+        return await post_handler(request, 201, "Inventory created successfully", add_inventory_handler, database_session, "/leftover/remove")
     except ValidityError as v_error:
         raise HTTPException(status_code=422, detail=str(v_error))
     except Exception as e:
@@ -124,25 +185,56 @@ async def remove_inventory(request: InventoryRequest, database_session: Session=
         raise HTTPException(status_code=500, detail=f"Error adding inventory, {e}")
 
 
+@router.post("/leftover/batch")
+async def add_inventories(request: List[InventoryRequest]=Body(..., min_length=1, max_length=BATCH_MAX_ITEMS),
+                          database_session: AsyncSession=Depends(get_session)):
+    try:
+        return await post_handler(request, 201, "Inventories processed successfully", add_inventories_handler, database_session, "/leftover/batch")
+    except Exception as e:
+        logger.exception(f"Error adding inventories, {e}")
+        raise HTTPException(status_code=500, detail=f"Error adding inventories, {e}")
+
+
 @router.post("/leftover/bulk")
-async def add_inventory_bulk(file: UploadFile=File(...), database_session: Session=Depends(get_session)):
+async def add_inventory_bulk(file: UploadFile=File(...), copy: bool=False, job: bool=False,
+                             database_session: Optional[AsyncSession]=Depends(get_bulk_upload_session)):
     """
     Update inventory in bulk based on the provided file.
 
     Args:
-        file (UploadFile): The file containing inventory data.
+        file (UploadFile): The file containing inventory data: BRC/QNT .txt, or (barcode, quantity)
+            rows without a header in .xlsx (first sheet) or .csv.
+        copy (bool): Ingest through PostgreSQL COPY. Files larger than
+            BULK_COPY_THRESHOLD_BYTES always are.
+        job (bool): Return 202 with a job at once and ingest the file in the background, on
+            connections of the jobs' own pool; GET /leftover/bulk/{job_id} reports its progress.
 
     Returns:
-        JSONResponse: A JSON response indicating the status of the inventory update.
+        ORJSONResponse: The rows written, and the rows and net quantity of every book the file
+            moved, rather than every row, so large files get a small response.
     """
     try:
+        if copy or (file.size or 0) > BULK_COPY_THRESHOLD_BYTES:
+            handler_func = add_inventory_copy_handler
+        else:
+            handler_func = add_inventory_bulk_handler
+        if job:
+            if not bulk_jobs.running:
+                raise HTTPException(status_code=503, detail="Bulk jobs are not running")
+            result = await bulk_jobs.submit(file, handler_func)
+            return Response(result, "Inventory job created successfully", 202)
         _, file_extension = os.path.splitext(file.filename)
-        contents = await file.read()
         if file_extension == ".txt":
-            dataframe = get_barcode_quantity_datagram_from_bytes(contents)
+            batches = iter_barcode_quantity_batches(file)
         elif file_extension == ".xlsx":
-            dataframe = pd.read_excel(BytesIO(contents), header=None)
-        return post_handler(dataframe, 201, "Inventory created successfully", add_inventory_bulk_handler, database_session)
+            batches = iter_row_batches(iter_xlsx_rows(file.file))
+        elif file_extension == ".csv":
+            batches = iter_row_batches(iter_csv_rows(file.file))
+        else:
+            raise ValidityError(f"Unsupported file type {file_extension}, expected .txt, .xlsx or .csv")
+        return await post_handler(batches, 201, "Inventory created successfully", handler_func, database_session, "/leftover/bulk")
+    except HTTPException as he:
+        raise he
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
     except EntityNotFoundError as ne:
@@ -155,10 +247,31 @@ async def add_inventory_bulk(file: UploadFile=File(...), database_session: Sessi
         raise HTTPException(status_code=500, detail=f"Error adding inventory, {e}")
 
 
+@router.get("/leftover/bulk/{job_id}")
+async def get_inventory_bulk_job(job_id: str, database_session: AsyncSession=Depends(get_session)):
+    """
+    Get the progress of a bulk import job: status (queued, running, succeeded or failed), rows
+    parsed and ingested, rows per second, and the first error with the status code a
+    synchronous upload would have failed with.
+    """
+    try:
+        result = await get_bulk_job_handler(database_session, job_id)
+        return Response(result, "Inventory job loaded successfully")
+    except EntityNotFoundError as ne:
+        raise HTTPException(status_code=404, detail=str(ne))
+    except Exception as e:
+        logger.exception(f"Error fetching bulk job {job_id}, {e}")
+        raise HTTPException(status_code=500, detail=f"Error fetching bulk job {job_id}, {e}")
+
+
 @router.get("/history")
 async def get_history(start: Optional[str]=Query(None, pattern=r"\d{4}-\d{2}-\d{2}"),
                       end: Optional[str]=Query(None, pattern=r"\d{4}-\d{2}-\d{2}"),
-                      book: Optional[str]=None, database_session: Session=Depends(get_session)):
+                      book: Optional[str]=None,
+                      after_book: Optional[int]=None,
+                      limit: Optional[int]=Query(None, ge=1, le=HISTORY_MAX_LIMIT),
+                      response_format: str=Query("json", alias="format", pattern=r"^(json|ndjson)$"),
+                      database_session: AsyncSession=Depends(get_read_session)):
     """
     Get the inventory history based on the provided start and end dates and book ID.
 
@@ -166,19 +279,32 @@ async def get_history(start: Optional[str]=Query(None, pattern=r"\d{4}-\d{2}-\d{
         start (Optional[str]): The start date in YYYY-MM-DD format (optional).
         end (Optional[str]): The end date in YYYY-MM-DD format (optional).
         book (Optional[str]): The book ID (optional).
+        after_book (Optional[int]): Only books with a greater key, the last key of the previous page (optional).
+        limit (Optional[int]): Maximum number of books in the page, ignored by the ndjson format (optional).
+        format (str): "json" for one response, "ndjson" to stream one book per line.
 
     Returns:
-        Response: A response containing the inventory history.
+        Response: A response containing the inventory history of every book, or with a limit,
+            one page of it and the next_after_book cursor.
     """
     try:
         if start is None:
             start = datetime.now().strftime("%Y-%m-%d")
         if end is None:
             end = datetime.now().strftime("%Y-%m-%d")
-        request = InventoryHistoryRequest(start=start, end=end, book=book)
+        request = InventoryHistoryRequest(start=start, end=end, book=book, after_book=after_book, limit=limit)
         request.check_request_validity()
-        result = get_book_history_handler(database_session, request)
-        logger.info(f"/history result: {result}")
+        if response_format == "ndjson":
+            history = await stream_book_history_handler(database_session, request)
+            lines = (orjson.dumps(data) + b"\n" async for data in history)
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+        if limit is None:
+            result = await get_book_history_handler(database_session, request)
+            books = len(result)
+        else:
+            result = await get_book_history_page_handler(database_session, request)
+            books = result["found"]
+        log_event(logger, logging.INFO, "history loaded", route="/history", books=books)
         return Response(result, "Book inventory history loaded successfully")
     except EntityNotFoundError as ne:
         raise HTTPException(status_code=404, detail=f"No book history, {ne}")
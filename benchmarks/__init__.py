@@ -0,0 +1,11 @@
+"""
+Benchmarks for the bookshop service.
+
+    python -m benchmarks.catalog   seed a synthetic catalog and write bulk upload files
+    python -m benchmarks.micro     time the parser, serialization helpers and handlers
+    python -m benchmarks.load      HTTP load per endpoint against a running server
+    python -m benchmarks.startup   application import time in fresh interpreters
+
+Every run writes its results as JSON under benchmarks/results/ so they can be compared
+across revisions with benchmarks.compare.
+"""
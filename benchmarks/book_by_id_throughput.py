@@ -0,0 +1,71 @@
+"""
+Concurrent GET /book/{id} throughput benchmark.
+
+Run it against a server started from two different revisions to compare them:
+
+    python benchmarks/book_by_id_throughput.py --url http://localhost:8000 --book-id 1
+
+--slow-book-id keeps one more client requesting a book with a large ledger while the
+measurement runs, not counted itself, to show how a slow query delays the others.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def worker(client: httpx.AsyncClient, path: str, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(url: str, book_id: int, concurrency: int, duration: float, slow_book_id: int=None) -> dict:
+    latencies = []
+    errors = []
+    clients = concurrency + (slow_book_id is not None)
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        # Warm up the connection pool before measuring
+        await client.get(f"/book/{book_id}")
+        deadline = time.perf_counter() + duration
+        workers = [worker(client, f"/book/{book_id}", deadline, latencies, errors) for _ in range(concurrency)]
+        if slow_book_id is not None:
+            workers.append(worker(client, f"/book/{slow_book_id}", deadline, [], []))
+        await asyncio.gather(*workers)
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / duration, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent GET /book/{id} throughput benchmark")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--book-id", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--slow-book-id", type=int, help="book requested by one more, uncounted, client meanwhile")
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        print(asyncio.run(run(args.url, args.book_id, concurrency, args.duration, args.slow_book_id)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Seeded synthetic catalog for benchmarks.
+
+Loads authors, books and an inventory ledger into the configured database with COPY,
+then rebuilds stock_balance and inventory_daily_balance from the ledger. The same seed
+and sizes always produce the same rows, so results from different revisions compare:
+
+    python -m benchmarks.catalog --authors 1000 --books 100000 --inventory 5000000
+    python -m benchmarks.catalog --skip-database --upload-rows 10000 100000 1000000
+
+Book ids run from 1 to --books and barcodes are BARCODE_BASE + id, which the upload
+files, micro-benchmarks and load driver rely on.
+
+Loading truncates author, book and every inventory table: never point it at a database
+whose data you want to keep.
+"""
+import argparse
+import asyncio
+import os
+from datetime import date, timedelta
+
+import numpy
+import pandas as pd
+from sqlalchemy import text
+
+from constants import BARCODE_PREFIX, QUANTITY_PREFIX
+
+BARCODE_BASE = 9780000000000
+COPY_CHUNK_ROWS = 100000
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+LEDGER_END = date(2024, 12, 31)
+OPENING_STOCK = 100
+
+
+def barcode(book_id: int) -> str:
+    return str(BARCODE_BASE + book_id)
+
+
+def author_records(authors: int, seed: int) -> list:
+    rng = numpy.random.default_rng([seed, 1])
+    birth_offsets = rng.integers(0, 365 * 80, authors).tolist()
+    return [(key, f"author {key}", str(date(1920, 1, 1) + timedelta(days=offset)))
+            for key, offset in enumerate(birth_offsets, start=1)]
+
+
+def book_records(books: int, authors: int, seed: int) -> list:
+    rng = numpy.random.default_rng([seed, 2])
+    author_ids = rng.integers(1, authors + 1, books).tolist()
+    years = rng.integers(1950, 2025, books).tolist()
+    return [(key, f"book {key}", year, author_id, barcode(key))
+            for key, (author_id, year) in enumerate(zip(author_ids, years), start=1)]
+
+
+def iter_inventory_chunks(rows: int, books: int, days: int, seed: int, chunk_rows: int=COPY_CHUNK_ROWS):
+    """
+    Yields the ledger as (book_id, quantity, date) chunks.
+
+    Every book opens with OPENING_STOCK copies on the first day, then gets `rows` random
+    movements. Book popularity is skewed (a few books get most movements) and additions
+    outnumber removals, so balances stay positive like a real shop's.
+    """
+    rng = numpy.random.default_rng([seed, 3])
+    calendar = [LEDGER_END - timedelta(days=offset) for offset in range(days)]
+    for start in range(1, books + 1, chunk_rows):
+        yield [(book_id, OPENING_STOCK, calendar[-1]) for book_id in range(start, min(start + chunk_rows, books + 1))]
+    for start in range(0, rows, chunk_rows):
+        size = min(chunk_rows, rows - start)
+        book_ids = (rng.zipf(1.3, size) - 1) % books + 1
+        quantities = rng.integers(-3, 11, size)
+        quantities[quantities == 0] = 1
+        day_offsets = rng.integers(0, days, size)
+        yield [(book_id, quantity, calendar[offset])
+               for book_id, quantity, offset in zip(book_ids.tolist(), quantities.tolist(), day_offsets.tolist())]
+
+
+def upload_rows(rows: int, books: int, seed: int) -> list:
+    """(barcode, quantity) pairs of a bulk upload; every barcode exists in the catalog."""
+    rng = numpy.random.default_rng([seed, 4, rows])
+    book_ids = rng.integers(1, books + 1, rows).tolist()
+    quantities = rng.integers(1, 20, rows).tolist()
+    return [(BARCODE_BASE + book_id, quantity) for book_id, quantity in zip(book_ids, quantities)]
+
+
+def upload_txt_bytes(pairs: list) -> bytes:
+    """Render pairs in the BRC/QNT text format of fixtures/txt_example.txt."""
+    lines = [f"FLN{len(pairs)}", f"ITC{len(pairs)}"]
+    for number, (barcode_value, quantity) in enumerate(pairs, start=1):
+        lines.extend((f"ITN{number}", f"{BARCODE_PREFIX}{barcode_value}", f"{QUANTITY_PREFIX}{quantity}"))
+    lines.append(f"ITT{sum(quantity for _, quantity in pairs)}")
+    return "\n".join(lines).encode()
+
+
+def write_upload_files(sizes: list, books: int, seed: int, directory: str=UPLOADS_DIR) -> list:
+    """Write upload-<rows>.txt and upload-<rows>.xlsx for each size and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for rows in sizes:
+        pairs = upload_rows(rows, books, seed)
+        txt_path = os.path.join(directory, f"upload-{rows}.txt")
+        with open(txt_path, "wb") as output:
+            output.write(upload_txt_bytes(pairs))
+        paths.append(txt_path)
+        # xlsx stops at 1048576 rows per sheet
+        if rows < 1048576:
+            xlsx_path = os.path.join(directory, f"upload-{rows}.xlsx")
+            pd.DataFrame(pairs).to_excel(xlsx_path, header=False, index=False)
+            paths.append(xlsx_path)
+    return paths
+
+
+async def load_catalog(authors: int, books: int, inventory: int, days: int, seed: int) -> dict:
+    from database.database import async_session, engine
+    from database.daily_balance import backfill_daily_balance
+    from database.migrate import migrate_database
+    from database.stock_balance import rebuild_stock_balance
+
+    await migrate_database(engine)
+    async with async_session() as session:
+        await session.exec(text("TRUNCATE inventory_archive, inventory_daily_balance, stock_balance, inventory, book, author "
+                                "RESTART IDENTITY CASCADE"))
+        connection = (await (await session.connection()).get_raw_connection()).driver_connection
+        await connection.copy_records_to_table("author", records=author_records(authors, seed),
+                                               columns=["id", "name", "birth_date"])
+        await connection.copy_records_to_table("book", records=book_records(books, authors, seed),
+                                               columns=["id", "title", "publish_year", "author_id", "barcode"])
+        for chunk in iter_inventory_chunks(inventory, books, days, seed):
+            await connection.copy_records_to_table("inventory", records=chunk,
+                                                   columns=["book_id", "quantity", "date"])
+        # Ids were copied explicitly; move the sequences past them
+        await session.exec(text("SELECT setval(pg_get_serial_sequence('author', 'id'), :value)"),
+                           params={"value": authors})
+        await session.exec(text("SELECT setval(pg_get_serial_sequence('book', 'id'), :value)"),
+                           params={"value": books})
+        await session.commit()
+
+        balances = await rebuild_stock_balance(session)
+        daily_rows = await backfill_daily_balance(session)
+        await session.exec(text("ANALYZE"))
+        await session.commit()
+    return {"authors": authors, "books": books, "inventory": books + inventory,
+            "stock_balance": balances, "inventory_daily_balance": daily_rows}
+
+
+async def main(args) -> None:
+    if not args.skip_database:
+        from database.database import engine
+
+        print(await load_catalog(args.authors, args.books, args.inventory, args.days, args.seed))
+        await engine.dispose()
+    for path in write_upload_files(args.upload_rows, args.books, args.seed, args.output):
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a seeded synthetic catalog and write bulk upload files")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--authors", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--inventory", type=int, default=5000000, help="inventory movements besides the opening stock of each book")
+    parser.add_argument("--days", type=int, default=730, help="days of history the ledger spans")
+    parser.add_argument("--upload-rows", type=int, nargs="*", default=[10000, 100000],
+                        help="rows of each generated upload file")
+    parser.add_argument("--output", default=UPLOADS_DIR, help="directory for upload files")
+    parser.add_argument("--skip-database", action="store_true", help="only write upload files")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,53 @@
+"""
+Compare two benchmark result files of the same kind:
+
+    python -m benchmarks.compare benchmarks/results/load-A.json benchmarks/results/load-B.json
+
+Prints p50/p95/p99 and throughput of every benchmark in both files with the relative change.
+"""
+import argparse
+
+import orjson
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "per_second")
+
+
+def result_key(result: dict) -> tuple:
+    return (result.get("name") or result.get("endpoint"), result.get("concurrency"))
+
+
+def load(path: str) -> dict:
+    with open(path, "rb") as source:
+        return orjson.loads(source.read())
+
+
+def change(before, after) -> str:
+    if before is None or after is None:
+        return ""
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    print(f"{before['revision']} ({before['created_at']}) -> {after['revision']} ({after['created_at']})")
+    before_results = {result_key(result): result for result in before["results"]}
+    for result in after["results"]:
+        key = result_key(result)
+        previous = before_results.get(key, {})
+        name = key[0] if key[1] is None else f"{key[0]} @{key[1]}"
+        print(name)
+        for metric in METRICS:
+            if metric in result or metric in previous:
+                print(f"    {metric:<12}{previous.get(metric)!s:>12} -> {result.get(metric)!s:<12}"
+                      f"{change(previous.get(metric), result.get(metric))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Stock and history reads as the inventory ledger grows, before and after compaction.
+
+For every --inventory size, loads the seeded catalog with that many movements and times
+three reads of hot books, drawn with the ledger's own skew: the stock read of GET /book/{id},
+the per-book ledger SUM it would cost without stock_balance, and a 30-day /history window.
+It then compacts the ledger before --horizon-days ahead of the ledger end, vacuums it like
+python -m database.compaction does, and times the same reads again:
+
+    DATABASE_NAME=bench_bookshop python -m benchmarks.ledger_growth --books 10000 --inventory 100000 1000000 5000000
+
+Loading truncates the catalog tables, like benchmarks.catalog. Results are printed and saved
+under benchmarks/results/.
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+
+import numpy
+from sqlalchemy import text
+
+from benchmarks.catalog import LEDGER_END, load_catalog
+from benchmarks.micro import clear_caches, time_handler
+from benchmarks.results import save_results
+from models import InventoryHistoryRequest
+
+
+async def ledger_size() -> dict:
+    from database.database import unit_of_work
+
+    async with unit_of_work() as session:
+        row = (await session.exec(text("""
+        SELECT
+            (SELECT COUNT(*) FROM inventory) AS rows,
+            pg_total_relation_size('inventory') AS size
+        """))).one()
+    return {"inventory_rows": row.rows, "inventory_mb": round(row.size / 1e6, 1)}
+
+
+async def time_reads(stage: str, book_ids: list, number: int) -> list:
+    from api.handlers import get_book_by_id_handler, get_book_history_handler
+
+    window_end = LEDGER_END.isoformat()
+    window_start = (LEDGER_END - timedelta(days=30)).isoformat()
+    ledger_sum = text("SELECT COALESCE(SUM(quantity), 0) FROM inventory WHERE book_id = :book_id")
+    results = [
+        await time_handler("stock read (get_book_by_id_handler)",
+                           lambda session, i: get_book_by_id_handler(session, book_ids[i]), number, clear_caches),
+        await time_handler("ledger sum per book",
+                           lambda session, i: session.exec(ledger_sum, params={"book_id": book_ids[i]}), number),
+        await time_handler("history one book, 30 days",
+                           lambda session, i: get_book_history_handler(session, InventoryHistoryRequest(
+                               start=window_start, end=window_end, book=str(book_ids[i]), limit=1)), number),
+    ]
+    return [{"stage": stage, **result} for result in results]
+
+
+async def run(args) -> list:
+    from database.compaction import compact_inventory, vacuum_ledger
+    from database.database import engine, unit_of_work
+
+    # Hot books, skewed like the movements of benchmarks.catalog
+    rng = numpy.random.default_rng(args.seed)
+    book_ids = ((rng.zipf(1.3, args.number) - 1) % args.books + 1).tolist()
+    horizon = LEDGER_END - timedelta(days=args.horizon_days)
+    results = []
+    for inventory in args.inventory:
+        await load_catalog(args.authors, args.books, inventory, args.days, args.seed)
+        before = await ledger_size()
+        results.extend({"movements": inventory, **before, **result}
+                       for result in await time_reads("full ledger", book_ids, args.number))
+
+        started = time.perf_counter()
+        totals = await compact_inventory(unit_of_work, horizon, args.period, args.batch_books)
+        await vacuum_ledger(engine)
+        elapsed = time.perf_counter() - started
+        after = await ledger_size()
+        results.append({"movements": inventory, "stage": "compaction", "horizon": horizon.isoformat(),
+                        "period": args.period, "seconds": round(elapsed, 1), **totals, **after})
+        results.extend({"movements": inventory, **after, **result}
+                       for result in await time_reads("compacted ledger", book_ids, args.number))
+    await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stock and history reads as the ledger grows, before and after compaction")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--authors", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--inventory", type=int, nargs="+", default=[100000, 1000000],
+                        help="ledger sizes to load, in movements besides the opening stock of each book")
+    parser.add_argument("--days", type=int, default=730, help="days of history the ledger spans")
+    parser.add_argument("--horizon-days", type=int, default=90, help="compact movements older than this before the ledger end")
+    parser.add_argument("--period", default="month")
+    parser.add_argument("--batch-books", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=500, help="calls per read")
+    parser.add_argument("--output", help="result file, default benchmarks/results/ledger_growth-<time>-<revision>.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for result in results:
+        print(result)
+    print(f"Saved {save_results('ledger_growth', vars(args), results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+HTTP load driver reporting latency percentiles and throughput per endpoint.
+
+Start the server against a database loaded by benchmarks.catalog, then run with the same
+--books and --seed:
+
+    DATABASE_NAME=bench_bookshop uvicorn main:app --port 8000
+    python -m benchmarks.load --url http://localhost:8000 --books 100000 --concurrency 1 10 50
+
+Each endpoint is driven on its own for --duration seconds at every concurrency level.
+--writes adds the endpoints that write, which append to the catalog. Results are printed
+and saved under benchmarks/results/.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import timedelta
+
+import httpx
+
+from benchmarks.catalog import LEDGER_END, barcode, upload_rows, upload_txt_bytes
+from benchmarks.results import save_results, summarize
+
+
+def read_scenarios(books: int, authors: int) -> dict:
+    """endpoint -> function building the keyword arguments of one request from a Random."""
+    window_end = LEDGER_END.isoformat()
+    window_start = (LEDGER_END - timedelta(days=30)).isoformat()
+    return {
+        "GET /ping": lambda rng: {"method": "GET", "url": "/ping"},
+        "GET /author/{author_id}": lambda rng: {"method": "GET", "url": f"/author/{rng.randint(1, authors)}"},
+        "GET /book/{book_id}": lambda rng: {"method": "GET", "url": f"/book/{rng.randint(1, books)}"},
+        "GET /book?barcode exact": lambda rng: {
+            "method": "GET", "url": "/book", "params": {"barcode": barcode(rng.randint(1, books))}},
+        "GET /book?barcode prefix": lambda rng: {
+            "method": "GET", "url": "/book", "params": {"barcode": barcode(rng.randint(1, books))[:-2]}},
+        "GET /history one book": lambda rng: {
+            "method": "GET", "url": "/history",
+            "params": {"start": window_start, "end": window_end, "book": rng.randint(1, books)}},
+        "GET /history 100 books": lambda rng: {
+            "method": "GET", "url": "/history",
+            "params": {"start": window_start, "end": window_end, "after_book": rng.randint(0, books), "limit": 100}},
+    }
+
+
+def write_scenarios(books: int, upload_size: int, seed: int) -> dict:
+    upload = upload_txt_bytes(upload_rows(upload_size, books, seed))
+    return {
+        "POST /leftover/add": lambda rng: {
+            "method": "POST", "url": "/leftover/add",
+            "json": {"barcode": barcode(rng.randint(1, books)), "quantity": 1}},
+        f"POST /leftover/bulk {upload_size} rows": lambda rng: {
+            "method": "POST", "url": "/leftover/bulk",
+            "files": {"file": (f"upload-{upload_size}.txt", upload, "text/plain")}},
+    }
+
+
+async def worker(client: httpx.AsyncClient, build_request, rng: random.Random, deadline: float,
+                 latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.request(**build_request(rng))
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(url: str, endpoint: str, build_request, concurrency: int, duration: float, seed: int) -> dict:
+    latencies = []
+    errors = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        # Warm up the connection pool and caches before measuring
+        await client.request(**build_request(random.Random(seed)))
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(worker(client, build_request, random.Random(seed * 1000 + number), deadline,
+                                      latencies, errors)
+                               for number in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "error_samples": sorted({str(error) for error in errors})[:5],
+        **summarize(latencies, elapsed),
+    }
+
+
+async def main(args) -> list:
+    scenarios = read_scenarios(args.books, args.authors)
+    if args.writes:
+        scenarios.update(write_scenarios(args.books, args.upload_rows, args.seed))
+    if args.endpoint:
+        scenarios = {endpoint: build for endpoint, build in scenarios.items()
+                     if any(selected in endpoint for selected in args.endpoint)}
+
+    results = []
+    for endpoint, build_request in scenarios.items():
+        for concurrency in args.concurrency:
+            result = await run(args.url, endpoint, build_request, concurrency, args.duration, args.seed)
+            print(result)
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP load per endpoint with p50/p95/p99 and throughput")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--seed", type=int, default=42, help="seed the catalog was loaded with")
+    parser.add_argument("--authors", type=int, default=1000, help="authors in the loaded catalog")
+    parser.add_argument("--books", type=int, default=100000, help="books in the loaded catalog")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint and concurrency level")
+    parser.add_argument("--endpoint", nargs="*", help="only endpoints whose name contains one of these")
+    parser.add_argument("--writes", action="store_true", help="also drive the endpoints that write")
+    parser.add_argument("--upload-rows", type=int, default=1000, help="rows per /leftover/bulk upload")
+    parser.add_argument("--output", help="result file, default benchmarks/results/load-<time>-<revision>.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    print(f"Saved {save_results('load', vars(args), results, args.output)}")
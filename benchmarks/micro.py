@@ -0,0 +1,172 @@
+"""
+Micro-benchmarks for the upload parser, serialization helpers and every handler.
+
+Handlers are called directly in a unit of work of their own, commit included, against a database loaded by
+benchmarks.catalog with the same --books and --seed:
+
+    DATABASE_NAME=bench_bookshop python -m benchmarks.micro --books 100000
+    DATABASE_NAME=bench_bookshop python -m benchmarks.micro --books 100000 --writes
+
+--writes adds the write handlers, which append to the catalog; reload it before the next
+run to keep results comparable. Results are printed and saved under benchmarks/results/.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from fastapi import UploadFile
+
+from benchmarks.catalog import LEDGER_END, barcode, upload_rows, upload_txt_bytes
+from benchmarks.results import save_results, summarize
+from cache import author_cache, book_cache
+from models import Author, Book, Inventory, InventoryHistoryRequest, InventoryRequest
+from utils import get_barcode_quantity_datagram_from_bytes, iter_barcode_quantity_batches, model_list_to_dict_list
+
+
+def time_calls(name: str, func, number: int) -> dict:
+    latencies = []
+    for _ in range(number):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return {"name": name, **summarize(latencies)}
+
+
+async def time_handler(name: str, call, number: int, reset=None) -> dict:
+    """Time `await call(session, iteration)` in a new unit of work each iteration; reset() runs untimed."""
+    from database.database import unit_of_work
+
+    latencies = []
+    for iteration in range(number):
+        if reset is not None:
+            reset()
+        started = time.perf_counter()
+        async with unit_of_work() as session:
+            await call(session, iteration)
+        latencies.append(time.perf_counter() - started)
+    return {"name": name, **summarize(latencies)}
+
+
+def clear_caches():
+    author_cache.clear()
+    book_cache.clear()
+
+
+async def drain(stream) -> int:
+    return sum([1 async for _ in await stream])
+
+
+def helper_benchmarks(args) -> list:
+    upload = upload_txt_bytes(upload_rows(args.upload_rows, args.books, args.seed))
+    inventories = [Inventory(id=key, book_id=key % args.books + 1, quantity=key % 7 - 3,
+                             date=LEDGER_END - timedelta(days=key % 365))
+                   for key in range(args.model_rows)]
+    return [
+        time_calls(f"get_barcode_quantity_datagram_from_bytes {args.upload_rows} rows",
+                   lambda: get_barcode_quantity_datagram_from_bytes(upload), args.helper_number),
+        time_calls(f"model_list_to_dict_list {args.model_rows} rows",
+                   lambda: model_list_to_dict_list(inventories), args.helper_number),
+    ]
+
+
+async def read_handler_benchmarks(args) -> list:
+    from api.handlers import (get_author_by_id_handler, get_book_by_barcode_handler, get_book_by_id_handler,
+                              get_book_history_handler, stream_book_history_handler)
+
+    rng = random.Random(args.seed)
+    book_ids = [rng.randint(1, args.books) for _ in range(args.number)]
+    author_ids = [rng.randint(1, args.authors) for _ in range(args.number)]
+    window_end = LEDGER_END.isoformat()
+    window_start = (LEDGER_END - timedelta(days=30)).isoformat()
+    number = args.number
+
+    return [
+        await time_handler("get_author_by_id_handler uncached",
+                           lambda session, i: get_author_by_id_handler(session, author_ids[i]), number, clear_caches),
+        await time_handler("get_author_by_id_handler cached",
+                           lambda session, i: get_author_by_id_handler(session, author_ids[0]), number),
+        await time_handler("get_book_by_id_handler uncached",
+                           lambda session, i: get_book_by_id_handler(session, book_ids[i]), number, clear_caches),
+        await time_handler("get_book_by_id_handler cached",
+                           lambda session, i: get_book_by_id_handler(session, book_ids[0]), number),
+        await time_handler("get_book_by_barcode_handler exact",
+                           lambda session, i: get_book_by_barcode_handler(session, barcode(book_ids[i])), number),
+        await time_handler("get_book_by_barcode_handler prefix, 100 per page",
+                           lambda session, i: get_book_by_barcode_handler(session, barcode(book_ids[i])[:-2]),
+                           number),
+        await time_handler("get_book_history_handler one book, 30 days",
+                           lambda session, i: get_book_history_handler(session, InventoryHistoryRequest(
+                               start=window_start, end=window_end, book=str(book_ids[i]), limit=1)), number),
+        await time_handler("get_book_history_handler 100 books, 30 days",
+                           lambda session, i: get_book_history_handler(session, InventoryHistoryRequest(
+                               start=window_start, end=window_end, book=None, after_book=book_ids[i] % 1000,
+                               limit=100)), number),
+        await time_handler("stream_book_history_handler every book, 30 days",
+                           lambda session, i: drain(stream_book_history_handler(session, InventoryHistoryRequest(
+                               start=window_start, end=window_end, book=None))), max(1, number // 50)),
+    ]
+
+
+async def write_handler_benchmarks(args) -> list:
+    from api.handlers import (add_author_handler, add_book_handler, add_inventory_bulk_handler,
+                              add_inventory_copy_handler, add_inventory_handler)
+
+    rng = random.Random(args.seed)
+    book_ids = [rng.randint(1, args.books) for _ in range(args.number)]
+    # New rows must not collide with the catalog or with an earlier --writes run
+    run = time.time_ns()
+    upload = upload_txt_bytes(upload_rows(args.upload_rows, args.books, args.seed))
+    bulk_number = max(1, args.number // 20)
+
+    def upload_batches():
+        return iter_barcode_quantity_batches(UploadFile(BytesIO(upload)))
+
+    return [
+        await time_handler("add_author_handler",
+                           lambda session, i: add_author_handler(session, Author(
+                               name=f"benchmark author {run}-{i}", birth_date="1970-01-01")), args.number),
+        await time_handler("add_book_handler",
+                           lambda session, i: add_book_handler(session, Book(
+                               title=f"benchmark book {run}-{i}", publish_year=2000, author=1,
+                               barcode=f"{run}{i:06d}")), args.number),
+        await time_handler("add_inventory_handler",
+                           lambda session, i: add_inventory_handler(session, InventoryRequest(
+                               barcode=barcode(book_ids[i]), quantity=1)), args.number),
+        await time_handler(f"add_inventory_bulk_handler {args.upload_rows} rows",
+                           lambda session, i: add_inventory_bulk_handler(session, upload_batches()), bulk_number),
+        await time_handler(f"add_inventory_copy_handler {args.upload_rows} rows",
+                           lambda session, i: add_inventory_copy_handler(session, upload_batches()), bulk_number),
+    ]
+
+
+async def main(args) -> list:
+    from database.database import engine
+
+    results = helper_benchmarks(args)
+    results.extend(await read_handler_benchmarks(args))
+    if args.writes:
+        results.extend(await write_handler_benchmarks(args))
+    await engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for helpers and handlers")
+    parser.add_argument("--seed", type=int, default=42, help="seed the catalog was loaded with")
+    parser.add_argument("--authors", type=int, default=1000, help="authors in the loaded catalog")
+    parser.add_argument("--books", type=int, default=100000, help="books in the loaded catalog")
+    parser.add_argument("--number", type=int, default=200, help="calls per handler")
+    parser.add_argument("--helper-number", type=int, default=20, help="calls per helper")
+    parser.add_argument("--upload-rows", type=int, default=10000, help="rows of the parsed and uploaded file")
+    parser.add_argument("--model-rows", type=int, default=10000, help="models converted by model_list_to_dict_list")
+    parser.add_argument("--writes", action="store_true", help="also time the handlers that write")
+    parser.add_argument("--output", help="result file, default benchmarks/results/micro-<time>-<revision>.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    for result in results:
+        print(result)
+    print(f"Saved {save_results('micro', vars(args), results, args.output)}")
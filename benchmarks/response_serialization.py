@@ -0,0 +1,106 @@
+"""
+Micro-benchmarks for serializing the largest response shapes.
+
+Compares the previous path (jsonable_encoder + stdlib json, with /history movements decoded
+from Postgres JSON first) with responses.Response on orjson:
+
+    python benchmarks/response_serialization.py
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import date
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from responses import Response  # noqa: E402
+
+
+def history_page(books: int, movements: int) -> list:
+    """A /history page; history is the JSON text Postgres returns for JSON_AGG."""
+    history = json.dumps([{"date": f"2024-01-{day % 28 + 1:02d}", "quantity": f"+{day}"}
+                          for day in range(movements)])
+    return [{
+        "book": {"key": key, "title": f"book {key}", "barcode": str(1000000 + key)},
+        "start_balance": key,
+        "end_balance": key + movements,
+        "history": history
+    } for key in range(books)]
+
+
+def barcode_search_page(items: int) -> dict:
+    return {
+        "found": items,
+        "items": [{
+            "id": key,
+            "title": f"book {key}",
+            "barcode": str(1000000 + key),
+            "author": {"name": f"author {key % 100}", "birth_date": "1970-01-01"},
+            "publish_year": 2000,
+            "quantity": key % 50
+        } for key in range(items)],
+        "next_after_barcode": str(1000000 + items - 1)
+    }
+
+
+def bulk_result(rows: int) -> list:
+    return [{"id": None, "book_id": row % 1000, "quantity": row % 7 - 3, "date": date(2024, 1, 1)}
+            for row in range(rows)]
+
+
+def stdlib_render(data) -> bytes:
+    content = jsonable_encoder({"data": data, "status": True, "message": "ok"})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def measure(name: str, old, new, number: int) -> dict:
+    old_seconds = min(timeit.repeat(old, number=number, repeat=3)) / number
+    new_seconds = min(timeit.repeat(new, number=number, repeat=3)) / number
+    return {
+        "shape": name,
+        "stdlib_ms": round(old_seconds * 1000, 3),
+        "orjson_ms": round(new_seconds * 1000, 3),
+        "speedup": round(old_seconds / new_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization micro-benchmarks")
+    parser.add_argument("--number", type=int, default=5, help="renders per measurement")
+    args = parser.parse_args()
+
+    history = history_page(1000, 50)
+    history_decoded = [{**data, "history": json.loads(data["history"])} for data in history]
+    history_fragments = [{**data, "history": orjson.Fragment(data["history"])} for data in history]
+    search = barcode_search_page(1000)
+    bulk = bulk_result(100000)
+
+    results = [
+        measure("history 1000 books x 50 movements",
+                lambda: stdlib_render([{**data, "history": json.loads(data["history"])} for data in history]),
+                lambda: Response([{**data, "history": orjson.Fragment(data["history"])} for data in history], "ok").body,
+                args.number),
+        measure("history, serialization only",
+                lambda: stdlib_render(history_decoded),
+                lambda: Response(history_fragments, "ok").body,
+                args.number),
+        measure("book barcode search 1000 items",
+                lambda: stdlib_render(search),
+                lambda: Response(search, "ok").body,
+                args.number),
+        measure("bulk upload result 100000 rows",
+                lambda: stdlib_render(bulk),
+                lambda: Response(bulk, "ok", 201).body,
+                args.number),
+    ]
+    for result in results:
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Latency summaries and JSON result files shared by the benchmark scripts.
+"""
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import orjson
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def summarize(latencies: list, duration: float=None) -> dict:
+    """p50/p95/p99 in milliseconds, plus throughput when the wall-clock duration is known."""
+    if not latencies:
+        return {"count": 0}
+    latencies = sorted(latencies)
+
+    def percentile(fraction: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 3)
+
+    summary = {
+        "count": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+    if duration:
+        summary["per_second"] = round(len(latencies) / duration, 1)
+    return summary
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(kind: str, parameters: dict, results: list, path: str=None) -> str:
+    """Write a result file tagged with the revision and environment it was measured on."""
+    started = datetime.now(timezone.utc)
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{kind}-{started:%Y%m%dT%H%M%SZ}-{git_revision()}.json")
+    document = {
+        "kind": kind,
+        "revision": git_revision(),
+        "created_at": started.isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(path, "wb") as output:
+        output.write(orjson.dumps(document, option=orjson.OPT_INDENT_2))
+    return path
@@ -0,0 +1,111 @@
+"""
+Spreadsheet parsing throughput for /leftover/bulk.
+
+Scales the rows of fixtures/xls_example_correct.xlsx up to --rows and compares reading
+them into ingestion batches with pd.read_excel (the previous path) against the streaming
+read-only .xlsx reader and the .csv reader:
+
+    python -m benchmarks.spreadsheet_ingestion --rows 10000 100000 500000
+
+Results are printed and saved under benchmarks/results/.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import itertools
+import os
+import time
+import tracemalloc
+
+import openpyxl
+import pandas as pd
+
+from benchmarks.results import save_results
+from constants import BULK_BATCH_SIZE
+from utils import iter_csv_rows, iter_row_batches, iter_xlsx_rows
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures",
+                       "xls_example_correct.xlsx")
+
+
+def scaled_rows(rows: int) -> list:
+    with open(FIXTURE, "rb") as file:
+        fixture_rows = list(iter_xlsx_rows(file))
+    return list(itertools.islice(itertools.cycle(fixture_rows), rows))
+
+
+def xlsx_bytes(rows: list) -> bytes:
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def csv_bytes(rows: list) -> bytes:
+    output = io.StringIO()
+    csv.writer(output).writerows(rows)
+    return output.getvalue().encode()
+
+
+async def read_excel_batches(data: bytes) -> int:
+    dataframe = pd.read_excel(io.BytesIO(data), header=None)
+    count = 0
+    for start in range(0, len(dataframe), BULK_BATCH_SIZE):
+        part = dataframe.iloc[start:start + BULK_BATCH_SIZE]
+        count += len(list(zip(part.index, part.iloc[:, 0], part.iloc[:, 1])))
+    return count
+
+
+async def streamed_batches(rows) -> int:
+    return sum([len(batch) async for batch in iter_row_batches(rows)])
+
+
+def measure(name: str, make_reader, data: bytes, rows: int, memory: bool) -> dict:
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    count = asyncio.run(make_reader(data))
+    elapsed = time.perf_counter() - started
+    result = {
+        "reader": name,
+        "rows": rows,
+        "bytes": len(data),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(count / elapsed),
+        "megabytes_per_second": round(len(data) / elapsed / 1e6, 2),
+    }
+    if memory:
+        result["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+        tracemalloc.stop()
+    assert count == rows, f"{name} read {count} of {rows} rows"
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spreadsheet parsing throughput for /leftover/bulk")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--memory", action="store_true", help="also report peak Python memory (slower)")
+    parser.add_argument("--output", help="result file, default benchmarks/results/spreadsheet_ingestion-<time>-<revision>.json")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.rows:
+        data = scaled_rows(rows)
+        xlsx, text = xlsx_bytes(data), csv_bytes(data)
+        for name, make_reader, payload in (
+            ("pd.read_excel", read_excel_batches, xlsx),
+            ("streaming xlsx", lambda payload: streamed_batches(iter_xlsx_rows(io.BytesIO(payload))), xlsx),
+            ("csv", lambda payload: streamed_batches(iter_csv_rows(io.BytesIO(payload))), text),
+        ):
+            result = measure(name, make_reader, payload, rows, args.memory)
+            print(result)
+            results.append(result)
+    print(f"Saved {save_results('spreadsheet_ingestion', vars(args), results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Cold start: how long a fresh interpreter takes to import the application.
+
+Runs `python -X importtime -c "import main"` --runs times in new processes and reports the
+cumulative import time of main, the wall time of the process, the slowest top-level
+packages, and which of the bulk-upload-only packages were imported at all:
+
+    python -m benchmarks.startup --runs 20
+
+Results are printed and saved under benchmarks/results/.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.results import save_results, summarize
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Only the bulk upload path needs these
+BULK_ONLY_PACKAGES = ("pandas", "numpy", "openpyxl")
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Cumulative import seconds of every module listed by -X importtime."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative) / 1e6
+    return modules
+
+
+def import_once(module: str) -> tuple:
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, parse_importtime(process.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Application import time in fresh interpreters")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level packages to report")
+    parser.add_argument("--output", help="result file, default benchmarks/results/startup-<time>-<revision>.json")
+    args = parser.parse_args()
+
+    # The first run compiles bytecode and warms the file cache
+    import_once(args.module)
+    runs = [import_once(args.module) for _ in range(args.runs)]
+    walls = [wall for wall, _ in runs]
+    imports = [modules[args.module] for _, modules in runs]
+    packages = {}
+    for _, modules in runs:
+        for name, seconds in modules.items():
+            if "." not in name and name != args.module:
+                packages.setdefault(name, []).append(seconds)
+    slowest = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:args.top]
+
+    results = [
+        {"name": f"import {args.module}", **summarize(imports)},
+        {"name": "process wall time", **summarize(walls)},
+        {
+            "name": "packages",
+            "slowest_ms": {name: round(statistics.median(seconds) * 1000, 1) for name, seconds in slowest},
+            "bulk_only_imported": [name for name in BULK_ONLY_PACKAGES if name in packages],
+        },
+    ]
+    for result in results:
+        print(result)
+    print(f"Saved {save_results('startup', vars(args), results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
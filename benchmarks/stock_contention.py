@@ -0,0 +1,95 @@
+"""
+Concurrent /leftover/remove against a handful of hot titles.
+
+Stocks --titles books with --stock copies each through the API, then has --clients clients
+sell single copies of random hot titles until every copy is gone. Reports throughput and
+checks correctness: no title may sell more copies than it had, and every title must end
+at zero stock.
+
+    python -m benchmarks.stock_contention --url http://localhost:8000 --titles 5 --stock 2000 --clients 100
+
+Results are printed and saved under benchmarks/results/.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks.results import save_results, summarize
+
+
+async def create_titles(client: httpx.AsyncClient, titles: int, stock: int, run: int) -> list:
+    author = (await client.post("/author", json={"name": f"contention author {run}",
+                                                 "birth_date": "1970-01-01"})).json()["data"]
+    books = []
+    for number in range(titles):
+        barcode = f"{run}{number:03d}"
+        book = (await client.post("/book", json={"title": f"contention book {run}-{number}", "publish_year": 2000,
+                                                 "author": author["id"], "barcode": barcode})).json()["data"]
+        response = await client.post("/leftover/add", json={"barcode": barcode, "quantity": stock})
+        response.raise_for_status()
+        books.append({"id": book["id"], "barcode": barcode})
+    return books
+
+
+async def seller(client: httpx.AsyncClient, books: list, rng: random.Random, sold: dict, sold_out: set,
+                 latencies: list, errors: list):
+    while len(sold_out) < len(books):
+        book = rng.choice([book for book in books if book["barcode"] not in sold_out])
+        started = time.perf_counter()
+        response = await client.post("/leftover/remove", json={"barcode": book["barcode"], "quantity": 1})
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 201:
+            sold[book["barcode"]] += 1
+        elif "No enough" in response.text:
+            sold_out.add(book["barcode"])
+        else:
+            errors.append(response.status_code)
+
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        books = await create_titles(client, args.titles, args.stock, time.time_ns() // 1000)
+        sold = {book["barcode"]: 0 for book in books}
+        sold_out = set()
+        latencies = []
+        errors = []
+        started = time.perf_counter()
+        await asyncio.gather(*(seller(client, books, random.Random(args.seed * 1000 + number), sold, sold_out,
+                                      latencies, errors)
+                               for number in range(args.clients)))
+        elapsed = time.perf_counter() - started
+        final_stock = {book["barcode"]: (await client.get(f"/book/{book['id']}")).json()["data"]["quantity"]
+                       for book in books}
+
+    oversold = {barcode: count - args.stock for barcode, count in sold.items() if count > args.stock}
+    return {
+        "titles": args.titles,
+        "stock_per_title": args.stock,
+        "clients": args.clients,
+        "sold": sum(sold.values()),
+        "sales_per_second": round(sum(sold.values()) / elapsed, 1),
+        "oversold": oversold,
+        "final_stock": final_stock,
+        "correct": not oversold and not errors and all(quantity == 0 for quantity in final_stock.values()),
+        "errors": len(errors),
+        **summarize(latencies, elapsed),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent /leftover/remove of a few hot titles")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--titles", type=int, default=5, help="hot titles sold concurrently")
+    parser.add_argument("--stock", type=int, default=1000, help="copies of each title")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--output", help="result file, default benchmarks/results/stock_contention-<time>-<revision>.json")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(result)
+    print(f"Saved {save_results('stock_contention', vars(args), [result], args.output)}")
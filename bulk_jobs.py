@@ -0,0 +1,194 @@
+"""
+Bulk inventory imports run as background jobs.
+
+POST /leftover/bulk?job=true spools the upload to disk and returns at once. The file is
+parsed in a process pool: BRC/QNT and .csv files are split at line boundaries into ranges
+parsed in parallel, .xlsx files by one process. Parsed rows are ingested in order, in
+BULK_BATCH_SIZE batches, by the same handler and in one transaction as a synchronous upload,
+so a job writes every row or none and fails on the same first row. Progress and the first
+error are kept in the bulk_job table, so any worker can report them.
+"""
+import asyncio
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing
+from datetime import datetime
+
+from sqlalchemy import update
+
+from constants import BARCODE_PREFIX, BULK_BATCH_SIZE
+from errors import EntityNotFoundError, ValidityError
+from models import BulkJob
+from utils import logger, split_file_ranges, parse_barcode_quantity_range, parse_csv_range, parse_xlsx_file
+
+
+def error_status(error: Exception) -> int:
+    """The status code a synchronous upload failing with this error gets."""
+    if isinstance(error, (EntityNotFoundError, FileNotFoundError)):
+        return 404
+    if isinstance(error, ValidityError):
+        return 400
+    return 500
+
+
+def bulk_job_to_dict(job: BulkJob) -> dict:
+    """The job's status with its ingestion rate so far, or over the whole run once it finished."""
+    result = job.model_dump()
+    rows_per_second = None
+    if job.started_at is not None:
+        elapsed = ((job.finished_at or datetime.now()) - job.started_at).total_seconds()
+        rows_per_second = round(job.rows_ingested / elapsed, 1) if elapsed > 0 else None
+    result["rows_per_second"] = rows_per_second
+    return result
+
+
+class BulkJobRunner:
+    def __init__(self, spool_dir: str, workers: int, range_bytes: int, concurrency: int):
+        """
+        Args:
+            spool_dir (str): where uploads wait to be parsed.
+            workers (int): parser processes.
+            range_bytes (int): bytes of BRC/QNT or .csv parsed by one process at a time.
+            concurrency (int): jobs ingested at once, each holding one connection for the ingest
+                and taking another for its progress updates.
+        """
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.range_bytes = range_bytes
+        self.concurrency = concurrency
+        self.running = False
+        self._executor = None
+        self._semaphore = None
+        self._tasks = {}
+        self._unit_of_work = None
+
+    async def start(self, unit_of_work):
+        """Start accepting jobs; unit_of_work() opens the sessions jobs are recorded and ingested in."""
+        self._unit_of_work = unit_of_work
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Parser processes are spawned, not forked, since the server has running threads and
+        # open connections a forked child would inherit
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.running = True
+
+    async def submit(self, file, handler_func) -> dict:
+        """
+        Spool an upload and start ingesting it in the background.
+
+        Args:
+            file (UploadFile): a .txt, .xlsx or .csv upload.
+            handler_func: `async (session, batches) -> dict` writing batches of
+                (row index, barcode, quantity), add_inventory_bulk_handler or add_inventory_copy_handler.
+
+        Returns:
+            Dict: the queued job.
+        """
+        _, extension = os.path.splitext(file.filename)
+        if extension not in (".txt", ".xlsx", ".csv"):
+            raise ValidityError(f"Unsupported file type {extension}, expected .txt, .xlsx or .csv")
+        job = BulkJob(id=uuid.uuid4().hex, file_name=file.filename, created_at=datetime.now())
+        path = os.path.join(self.spool_dir, f"{job.id}{extension}")
+
+        def spool():
+            file.file.seek(0)
+            with open(path, "wb") as spool_file:
+                shutil.copyfileobj(file.file, spool_file)
+
+        await asyncio.to_thread(spool)
+        # Committed before the job starts so its progress updates find the row
+        async with self._unit_of_work() as session:
+            session.add(job)
+        task = asyncio.get_running_loop().create_task(self._run(job.id, path, handler_func))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return bulk_job_to_dict(job)
+
+    async def wait(self):
+        """Wait for every submitted job to finish."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def stop(self):
+        """Stop the running jobs, which roll back and are reported failed, and the parser processes."""
+        if not self.running:
+            return
+        self.running = False
+        # Let jobs submitted just now start, so they too clean up and record why they stopped
+        await asyncio.sleep(0)
+        for task in self._tasks.values():
+            task.cancel()
+        await self.wait()
+        self._executor.shutdown(cancel_futures=True)
+
+    async def _update(self, job_id: str, **values):
+        async with self._unit_of_work() as session:
+            await session.exec(update(BulkJob).where(BulkJob.id == job_id).values(**values))
+
+    async def _run(self, job_id: str, path: str, handler_func):
+        try:
+            async with self._semaphore:
+                await self._update(job_id, status="running", started_at=datetime.now())
+                started = time.perf_counter()
+                async with self._unit_of_work() as session:
+                    async with aclosing(self._batches(job_id, path)) as batches:
+                        result = await handler_func(session, batches)
+                await self._update(job_id, status="succeeded", rows_ingested=result["rows"], finished_at=datetime.now())
+                logger.info(f"Bulk job {job_id} ingested {result['rows']} rows in {time.perf_counter() - started:.1f}s")
+        except asyncio.CancelledError:
+            await self._update(job_id, status="failed", error="Server stopped before the job finished",
+                               error_status=503, finished_at=datetime.now())
+            raise
+        except Exception as e:
+            logger.error(f"Bulk job {job_id} failed, {e}")
+            await self._update(job_id, status="failed", error=str(e), error_status=error_status(e),
+                               finished_at=datetime.now())
+        finally:
+            os.remove(path)
+
+    def _parse_tasks(self, path: str) -> list:
+        extension = os.path.splitext(path)[1]
+        if extension == ".xlsx":
+            return [(parse_xlsx_file, path)]
+        parse, prefix = ((parse_barcode_quantity_range, BARCODE_PREFIX.encode()) if extension == ".txt"
+                         else (parse_csv_range, b""))
+        return [(parse, path, start, end) for start, end in split_file_ranges(path, self.range_bytes, prefix)]
+
+    async def _batches(self, job_id: str, path: str):
+        """
+        Yield the upload's batches of (row index, barcode, quantity) in file order.
+
+        Ranges are parsed ahead of ingestion, one per parser process plus one at a time, and
+        the progress is recorded every time the handler asks for the next batch.
+        """
+        loop = asyncio.get_running_loop()
+        tasks = iter(await asyncio.to_thread(self._parse_tasks, path))
+        in_flight = deque()
+
+        def parse_next():
+            task = next(tasks, None)
+            if task is not None:
+                in_flight.append(loop.run_in_executor(self._executor, *task))
+
+        for _ in range(self.workers + 1):
+            parse_next()
+        rows_parsed = 0
+        try:
+            while in_flight:
+                rows = await in_flight.popleft()
+                parse_next()
+                for start in range(0, len(rows), BULK_BATCH_SIZE):
+                    batch = [(rows_parsed + index, barcode, quantity)
+                             for index, (barcode, quantity) in enumerate(rows[start:start + BULK_BATCH_SIZE], start)]
+                    yield batch
+                    await self._update(job_id, rows_parsed=rows_parsed + len(rows),
+                                       rows_ingested=rows_parsed + start + len(batch))
+                rows_parsed += len(rows)
+        finally:
+            for future in in_flight:
+                future.cancel()
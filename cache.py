@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+
+from exporter import CACHE_MAX_SIZE, CACHE_TTL_SECONDS
+
+
+class LRUCache:
+    """
+    Bounded in-process cache with least-recently-used eviction and a time to live.
+
+    invalidate() also calls every registered invalidation hook with (cache name, key) so
+    that other worker processes can drop the same entry.
+    """
+
+    def __init__(self, name: str, max_size: int=CACHE_MAX_SIZE, ttl: float=CACHE_TTL_SECONDS):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value of key, or None when it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key):
+        """Drop key from this process only."""
+        self._entries.pop(key, None)
+
+    def invalidate(self, key):
+        """Drop key here and, through the invalidation hooks, in every other worker."""
+        self.discard(key)
+        for hook in invalidation_hooks:
+            hook(self.name, key)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# callables(cache name, key) run on every invalidate(), e.g. to notify other workers
+invalidation_hooks = []
+
+author_cache = LRUCache("author")
+book_cache = LRUCache("book")
+
+caches = {cache.name: cache for cache in (author_cache, book_cache)}
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in caches.items()}
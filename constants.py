@@ -5,3 +5,19 @@ RESP_MESSAGE = "message"
 
 BARCODE_PREFIX = "BRC"
 QUANTITY_PREFIX = "QNT"
+
+# bulk upload streaming
+BULK_CHUNK_SIZE = 1024 * 1024
+BULK_BATCH_SIZE = 5000
+
+# GET /book?barcode= page size
+BOOK_SEARCH_DEFAULT_LIMIT = 100
+BOOK_SEARCH_MAX_LIMIT = 1000
+# GET /book?ids= and ?barcodes= keys per request
+BOOK_MULTI_GET_MAX_ITEMS = 1000
+
+# GET /history?limit= page size, every book without one
+HISTORY_MAX_LIMIT = 1000
+
+# POST /author/batch, /book/batch and /leftover/batch items per request
+BATCH_MAX_ITEMS = 1000
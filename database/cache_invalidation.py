@@ -0,0 +1,62 @@
+"""
+Optional cross-worker cache invalidation over PostgreSQL LISTEN/NOTIFY.
+
+When CACHE_INVALIDATION_CHANNEL is set, every worker keeps one connection listening on
+that channel; LRUCache.invalidate() in any worker publishes the (cache, key) pair and the
+other workers drop their copy of the entry.
+"""
+import asyncio
+import json
+import uuid
+
+import asyncpg
+
+from cache import caches, invalidation_hooks
+from utils import logger
+
+# Identifies this worker's own notifications (container pids are not unique across hosts)
+WORKER_ID = uuid.uuid4().hex
+
+
+class CacheInvalidationListener:
+    def __init__(self, engine, channel: str):
+        self.engine = engine
+        self.channel = channel
+        self._connection = None
+        self._lock = asyncio.Lock()
+        self._pending = set()
+
+    async def start(self):
+        # A dedicated connection outside the pool, since it listens for the worker's lifetime
+        url = self.engine.url.set(drivername="postgresql")
+        self._connection = await asyncpg.connect(url.render_as_string(hide_password=False))
+        await self._connection.add_listener(self.channel, self._on_notification)
+        invalidation_hooks.append(self.publish)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        message = json.loads(payload)
+        if message["worker"] == WORKER_ID:
+            return
+        cache = caches.get(message["cache"])
+        if cache is not None:
+            cache.discard(message["key"])
+
+    def publish(self, cache_name: str, key):
+        payload = json.dumps({"worker": WORKER_ID, "cache": cache_name, "key": key})
+        task = asyncio.get_running_loop().create_task(self._notify(payload))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _notify(self, payload: str):
+        try:
+            async with self._lock:
+                await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        except Exception as e:
+            logger.exception(f"Error publishing cache invalidation {payload}, {e}")
+
+    async def stop(self):
+        invalidation_hooks.remove(self.publish)
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        await self._connection.remove_listener(self.channel, self._on_notification)
+        await self._connection.close()
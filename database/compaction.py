@@ -0,0 +1,152 @@
+"""
+Inventory ledger compaction and archival.
+
+`inventory` is append-only, so it grows with every movement. Compaction folds every
+movement dated before a horizon into one opening row per book per period, flagged
+`opening` and dated on the first day of the period. It moves the raw rows to
+`inventory_archive` and folds `inventory_daily_balance` the same way. Compaction does not
+change the ledger sum of a book, its stock balance, or any closing balance from the horizon
+on. Current stock and /history windows starting on or after the horizon therefore come out
+the same. Older windows see one movement per period.
+
+Books are compacted in batches, one transaction per batch. Each transaction locks the
+stock_balance rows of its books first, the rows every inventory write updates, so it waits
+for writes to those books and holds new ones until it commits. Movements backdated past the
+horizon after a run stay raw until the next run, which adds them to the period's opening row.
+
+    python -m database.compaction                     # INVENTORY_COMPACTION_HORIZON_DAYS ago, by INVENTORY_COMPACTION_PERIOD
+    python -m database.compaction --horizon 2024-01-01 --period quarter
+
+Then it vacuums the ledger, since index scans keep visiting the deleted rows until they are
+reclaimed (--no-vacuum leaves them to autovacuum).
+
+Nothing reads inventory_archive: dump or truncate it as your retention policy requires.
+"""
+import argparse
+import asyncio
+from datetime import date, timedelta
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from exporter import INVENTORY_COMPACTION_HORIZON_DAYS, INVENTORY_COMPACTION_PERIOD, INVENTORY_COMPACTION_BATCH_BOOKS
+
+PERIODS = ("day", "week", "month", "quarter", "year")
+
+
+async def compact_books(session: AsyncSession, book_ids: list, horizon: date, period: str) -> dict:
+    """
+    Compact the ledger and daily rollup of some books before horizon. The caller owns the
+    transaction and holds the stock_balance rows of the books.
+
+    Returns:
+        Dict: raw rows "archived" and "opening" rows written or added to.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown compaction period {period}, expected one of {', '.join(PERIODS)}")
+    parameters = {"book_ids": book_ids, "horizon": horizon, "period": period}
+    period_start = "CAST(DATE_TRUNC(CAST(:period AS TEXT), CAST({column} AS TIMESTAMP)) AS DATE)"
+    # The opening row of a period compacted before absorbs the movements backdated into it since
+    counts = (await session.exec(text(f"""
+    WITH moved AS (
+        DELETE FROM inventory
+        WHERE book_id = ANY(CAST(:book_ids AS INTEGER[])) AND date < :horizon AND NOT opening
+        RETURNING id, book_id, quantity, date
+    ),
+    archived AS (
+        INSERT INTO inventory_archive (id, book_id, quantity, date, archived_at)
+        SELECT id, book_id, quantity, date, LOCALTIMESTAMP
+        FROM moved
+        RETURNING id
+    ),
+    opened AS (
+        INSERT INTO inventory (book_id, quantity, date, opening)
+        SELECT book_id, SUM(quantity), {period_start.format(column="date")}, true
+        FROM moved
+        GROUP BY 1, 3
+        ON CONFLICT (book_id, date) WHERE opening DO UPDATE SET quantity = inventory.quantity + EXCLUDED.quantity
+        RETURNING id
+    )
+    SELECT (SELECT COUNT(*) FROM archived) AS archived, (SELECT COUNT(*) FROM opened) AS opening
+    """), params=parameters)).one()
+
+    # The rollup row of a period start takes the period's net movement and its last closing balance
+    await session.exec(text(f"""
+    INSERT INTO inventory_daily_balance (book_id, day, net_quantity, closing_balance)
+    SELECT book_id, {period_start.format(column="day")}, SUM(net_quantity),
+           (ARRAY_AGG(closing_balance ORDER BY day DESC))[1]
+    FROM inventory_daily_balance
+    WHERE book_id = ANY(CAST(:book_ids AS INTEGER[])) AND day < :horizon
+    GROUP BY 1, 2
+    ON CONFLICT (book_id, day) DO UPDATE SET
+        net_quantity = EXCLUDED.net_quantity,
+        closing_balance = EXCLUDED.closing_balance
+    """), params=parameters)
+    await session.exec(text(f"""
+    DELETE FROM inventory_daily_balance
+    WHERE book_id = ANY(CAST(:book_ids AS INTEGER[])) AND day < :horizon
+        AND day <> {period_start.format(column="day")}
+    """), params=parameters)
+    return {"archived": counts.archived, "opening": counts.opening}
+
+
+async def compact_inventory(unit_of_work, horizon: date, period: str=INVENTORY_COMPACTION_PERIOD,
+                            batch_books: int=INVENTORY_COMPACTION_BATCH_BOOKS) -> dict:
+    """
+    Compact every book's ledger before horizon, batch_books books per unit_of_work().
+
+    Returns:
+        Dict: books visited, raw rows archived and opening rows written or added to.
+    """
+    totals = {"books": 0, "archived": 0, "opening": 0}
+    after_book = 0
+    while True:
+        async with unit_of_work() as session:
+            # Every book with movements has a balance row; locked in key order like the writers do
+            book_ids = list((await session.exec(text("""
+            SELECT book_id
+            FROM stock_balance
+            WHERE book_id > :after_book
+            ORDER BY book_id
+            LIMIT :limit
+            FOR UPDATE
+            """), params={"after_book": after_book, "limit": batch_books})).scalars())
+            if not book_ids:
+                return totals
+            counts = await compact_books(session, book_ids, horizon, period)
+        totals["books"] += len(book_ids)
+        totals["archived"] += counts["archived"]
+        totals["opening"] += counts["opening"]
+        after_book = book_ids[-1]
+
+
+async def vacuum_ledger(engine) -> None:
+    """Reclaim the space of the compacted rows, so index scans stop visiting them, and refresh statistics."""
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("VACUUM (ANALYZE) inventory, inventory_daily_balance"))
+
+
+async def main(horizon: date, period: str, batch_books: int, vacuum: bool):
+    from database.database import engine, unit_of_work
+
+    totals = await compact_inventory(unit_of_work, horizon, period, batch_books)
+    print(f"Compacted movements before {horizon} by {period}: {totals['archived']} rows archived into "
+          f"{totals['opening']} opening rows across {totals['books']} books")
+    if vacuum:
+        await vacuum_ledger(engine)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold old inventory movements into opening rows and archive them")
+    parser.add_argument("--horizon", type=date.fromisoformat,
+                        default=date.today() - timedelta(days=INVENTORY_COMPACTION_HORIZON_DAYS),
+                        help="compact movements dated before this day (YYYY-MM-DD)")
+    parser.add_argument("--period", choices=PERIODS, default=INVENTORY_COMPACTION_PERIOD)
+    parser.add_argument("--batch-books", type=int, default=INVENTORY_COMPACTION_BATCH_BOOKS,
+                        help="books compacted per transaction")
+    parser.add_argument("--no-vacuum", dest="vacuum", action="store_false",
+                        help="leave the compacted rows to autovacuum instead of vacuuming the ledger afterwards")
+    args = parser.parse_args()
+    asyncio.run(main(args.horizon, args.period, args.batch_books, args.vacuum))
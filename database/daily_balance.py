@@ -0,0 +1,105 @@
+"""
+Per-book, per-day inventory rollup.
+
+`inventory_daily_balance` holds the net movement of every book on every day it moved and
+its closing balance at the end of that day, so /history reads its start and end balances
+from at most two rows instead of re-aggregating the ledger. It is updated in the same
+transaction as every `inventory` insert through `apply_daily_movements`.
+
+Build it from the existing ledger:
+
+    python -m database.daily_balance
+"""
+import asyncio
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+async def apply_daily_movements(session: AsyncSession, movements: dict) -> None:
+    """
+    Add the net quantity of each (book, day) to the rollup, carrying it into the closing
+    balance of every later day of the book. The caller owns the transaction.
+
+    Args:
+        movements (Dict[Tuple[int, date], int]): (book id, day) -> net quantity change.
+    """
+    if not movements:
+        return
+    keys = sorted(movements)
+    parameters = {
+        "book_ids": [book_id for book_id, _ in keys],
+        "days": [day for _, day in keys],
+        "quantities": [movements[key] for key in keys],
+    }
+    movements_query = """
+    movements AS (
+        SELECT *
+        FROM UNNEST(CAST(:book_ids AS INTEGER[]), CAST(:days AS DATE[]), CAST(:quantities AS BIGINT[]))
+            AS m(book_id, day, quantity)
+    )
+    """
+    await session.exec(text(f"""
+    WITH {movements_query}
+    INSERT INTO inventory_daily_balance (book_id, day, net_quantity, closing_balance)
+    SELECT
+        m.book_id,
+        m.day,
+        m.quantity,
+        m.quantity + COALESCE((
+            SELECT d.closing_balance
+            FROM inventory_daily_balance d
+            WHERE d.book_id = m.book_id AND d.day < m.day
+            ORDER BY d.day DESC
+            LIMIT 1
+        ), 0)
+    FROM movements m
+    ON CONFLICT (book_id, day) DO UPDATE SET
+        net_quantity = inventory_daily_balance.net_quantity + EXCLUDED.net_quantity,
+        closing_balance = inventory_daily_balance.closing_balance + EXCLUDED.net_quantity
+    """), params=parameters)
+    # Movements dated before existing days (backdated or compacted rows) move their closing balances too
+    await session.exec(text(f"""
+    WITH {movements_query}
+    UPDATE inventory_daily_balance d
+    SET closing_balance = d.closing_balance + later.quantity
+    FROM (
+        SELECT d2.book_id, d2.day, SUM(m.quantity) AS quantity
+        FROM inventory_daily_balance d2
+        JOIN movements m ON m.book_id = d2.book_id AND m.day < d2.day
+        GROUP BY d2.book_id, d2.day
+    ) later
+    WHERE d.book_id = later.book_id AND d.day = later.day
+    """), params=parameters)
+
+
+async def backfill_daily_balance(session: AsyncSession) -> int:
+    """Rebuild the whole rollup from the ledger and return the number of rollup rows."""
+    # Block concurrent inventory writes so the rollup matches the ledger
+    await session.exec(text("LOCK TABLE inventory IN SHARE MODE"))
+    await session.exec(text("DELETE FROM inventory_daily_balance"))
+    result = await session.exec(text("""
+    INSERT INTO inventory_daily_balance (book_id, day, net_quantity, closing_balance)
+    SELECT
+        book_id,
+        date,
+        SUM(quantity),
+        SUM(SUM(quantity)) OVER (PARTITION BY book_id ORDER BY date)
+    FROM inventory
+    GROUP BY book_id, date
+    """))
+    await session.commit()
+    return result.rowcount
+
+
+async def main():
+    from database.database import async_session, engine
+
+    async with async_session() as session:
+        count = await backfill_daily_balance(session)
+        print(f"Built {count} daily balance rows")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,21 +1,134 @@
-from sqlmodel import SQLModel, Session, create_engine
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from typing import Optional
+
+from fastapi import Request
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from metrics import MeasuredQueuePool, instrument_engine
+from exporter import (DATABASE_URL, DATABASE_NAME, DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, DATABASE_POOL_TIMEOUT,
+                      DATABASE_POOL_PRE_PING, DATABASE_POOL_RECYCLE, DATABASE_REPLICA_URL,
+                      DATABASE_READ_YOUR_WRITES_SECONDS, BULK_JOB_CONCURRENCY)
+
+# A request sending this header, or carrying this cookie, reads from the primary
+READ_YOUR_WRITES_HEADER = "x-read-your-writes"
+READ_YOUR_WRITES_COOKIE = "read_your_writes"
+
+
+def get_async_database_url(database_url: str) -> str:
+    """Point a plain postgresql:// URL at the asyncpg driver."""
+    if database_url.startswith("postgresql://"):
+        return database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return database_url
+
+
+def create_pooled_engine(database_url: str, pool_size: int=DATABASE_POOL_SIZE, max_overflow: int=DATABASE_MAX_OVERFLOW,
+                         **options):
+    return create_async_engine(get_async_database_url(database_url)+DATABASE_NAME, echo=False,
+                               pool_size=pool_size, max_overflow=max_overflow,
+                               pool_timeout=DATABASE_POOL_TIMEOUT, pool_pre_ping=DATABASE_POOL_PRE_PING,
+                               pool_recycle=DATABASE_POOL_RECYCLE, poolclass=MeasuredQueuePool, **options)
 
-from exporter import DATABASE_URL, DATABASE_NAME
 
 # SQLModel setup
-engine = create_engine(DATABASE_URL+DATABASE_NAME, echo=True)
+engine = create_pooled_engine(DATABASE_URL)
+instrument_engine(engine)
+
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+# Background bulk jobs have a pool of their own, so a burst of jobs can't take the connections
+# requests need: per running job one for the ingest and one for its progress updates, plus one
+# to record new jobs
+job_engine = create_pooled_engine(DATABASE_URL, pool_size=2 * BULK_JOB_CONCURRENCY + 1, max_overflow=0)
+instrument_engine(job_engine, "jobs")
 
+job_session = async_sessionmaker(job_engine, class_=AsyncSession, expire_on_commit=False)
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+# Optional read replica, see get_read_session. Its transactions are READ ONLY, so a handler
+# writing through it fails even when the "replica" is the primary under another role
+replica_engine = None
+replica_session = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_pooled_engine(DATABASE_REPLICA_URL, execution_options={"postgresql_readonly": True})
+    instrument_engine(replica_engine, "replica")
+    replica_session = async_sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False)
 
 
-executor = ThreadPoolExecutor(max_workers=5)  # Adjust the number of workers as needed
+@asynccontextmanager
+async def unit_of_work(session_factory=async_session):
+    """
+    One session, connection and transaction for everything a request does.
+
+    Handlers only flush; the transaction is committed when the block exits normally, rolled
+    back when it raises, and the connection goes back to the pool once, on exit.
+    """
+    async with session_factory() as session:
+        try:
+            yield session
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+
 
 # Function to get session asynchronously
-async def get_session() -> Session:
-    loop = asyncio.get_event_loop()
-    session = await loop.run_in_executor(executor, Session, bind=engine)
-    return session
\ No newline at end of file
+async def get_session() -> AsyncSession:
+    async with unit_of_work() as session:
+        yield session
+
+
+async def get_bulk_upload_session(job: bool=False) -> Optional[AsyncSession]:
+    """Session for POST /leftover/bulk; none for ?job=true, which is ingested on the jobs' pool."""
+    if job:
+        yield None
+        return
+    async with unit_of_work() as session:
+        yield session
+
+
+def reads_own_writes(request: Request) -> bool:
+    """Whether the client asked to see its latest writes, by header or by the cookie writes set."""
+    return (request.headers.get(READ_YOUR_WRITES_HEADER, "").lower() in ("1", "true")
+            or READ_YOUR_WRITES_COOKIE in request.cookies)
+
+
+async def get_read_session(request: Request) -> AsyncSession:
+    """
+    Session for read-only handlers: on the replica when one is configured, on the primary
+    when there is none or the request reads its own writes, since the replica may lag.
+    """
+    session_factory = async_session
+    if replica_session is not None and not reads_own_writes(request):
+        session_factory = replica_session
+    async with unit_of_work(session_factory) as session:
+        yield session
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware pinning a client's reads to the primary after it writes.
+
+    Every successful request other than GET, HEAD or OPTIONS sets the READ_YOUR_WRITES_COOKIE
+    cookie for DATABASE_READ_YOUR_WRITES_SECONDS; clients that do not keep cookies send the
+    READ_YOUR_WRITES_HEADER header instead. Does nothing without a replica.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or replica_session is None or DATABASE_READ_YOUR_WRITES_SECONDS <= 0
+                or scope["method"] in ("GET", "HEAD", "OPTIONS")):
+            await self.app(scope, receive, send)
+            return
+
+        cookie = (f"{READ_YOUR_WRITES_COOKIE}=1; Max-Age={DATABASE_READ_YOUR_WRITES_SECONDS}; Path=/; "
+                  f"HttpOnly; SameSite=Lax").encode()
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie)]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,87 @@
+"""
+Opt-in group commit for small writes.
+
+GroupCommitQueue coalesces the requests submitted within a short window (up to a maximum
+batch size) and hands them to one batch handler call in one unit of work, so a burst of
+single-item writes costs one transaction and one commit instead of one each. Every caller
+still gets its own result: the batch handler returns a result or an exception per request,
+and a failed commit fails every request that had succeeded.
+"""
+import asyncio
+
+from metrics import group_commit_batch_size
+from utils import logger
+
+
+class GroupCommitQueue:
+    def __init__(self, batch_handler, window_seconds: float, max_batch: int):
+        """
+        Args:
+            batch_handler: `async (session, requests) -> list` returning, in order, a result or
+                an exception instance for every request.
+            window_seconds (float): how long the first request of a batch waits for others.
+            max_batch (int): most requests written by one transaction.
+        """
+        self.batch_handler = batch_handler
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.running = False
+        self._queue = None
+        self._worker = None
+        self._unit_of_work = None
+
+    async def start(self, unit_of_work):
+        """Start coalescing; unit_of_work() opens the session each batch is written in."""
+        self._unit_of_work = unit_of_work
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+        self.running = True
+
+    async def submit(self, request):
+        """Queue a request and wait for the commit of its batch."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((request, future))
+        return await future
+
+    async def stop(self):
+        """Stop accepting requests and write every request queued before the call."""
+        if not self.running:
+            return
+        self.running = False
+        self._queue.put_nowait(None)
+        await self._worker
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            await asyncio.sleep(self.window_seconds)
+            batch = [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: list):
+        group_commit_batch_size.observe((), len(batch))
+        requests = [request for request, _ in batch]
+        results = None
+        try:
+            async with self._unit_of_work() as session:
+                results = await self.batch_handler(session, requests)
+        except Exception as e:
+            logger.exception(f"Error writing a group commit of {len(batch)} requests, {e}")
+            # Requests the handler had already rejected keep their own error
+            results = [result if isinstance(result, Exception) else e for result in (results or [e] * len(batch))]
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
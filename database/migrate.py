@@ -0,0 +1,138 @@
+"""
+Versioned schema migrations.
+
+The schema is owned by the SQL files in database/migrations, applied in file name order by a
+one-shot runner before the server starts rather than by every worker on every boot. The
+version of a file is its name up to the first "_"; applied versions are recorded in
+schema_migrations, in the same transaction as the file's statements unless the file manages
+its own transactions.
+
+    python -m database.migrate                  # apply pending migrations
+    python -m database.migrate --list           # show applied and pending migrations
+    python -m database.migrate --baseline 0005  # record 0005 and earlier as applied without running them
+
+--baseline is for databases whose schema was created before the runner existed.
+"""
+import argparse
+import asyncio
+import os
+import re
+
+import asyncpg
+from sqlalchemy import text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d+)_[a-z0-9_]+\.sql$")
+# Serializes runners started at the same time by several containers
+MIGRATION_LOCK_ID = 72_105_301
+
+SCHEMA_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR NOT NULL PRIMARY KEY,
+    name VARCHAR NOT NULL,
+    applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+)
+"""
+
+
+def migration_files(directory: str=MIGRATIONS_DIR) -> list:
+    """
+    Returns:
+        List[Tuple[str, str]]: (version, file name) of every migration, in order.
+    """
+    migrations = []
+    for name in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_PATTERN.match(name)
+        if match:
+            migrations.append((match.group(1), name))
+        elif name.endswith(".sql"):
+            raise ValueError(f"Migration file name {name} must look like 0001_lowercase_name.sql")
+    return migrations
+
+
+def record_statement(version: str, name: str) -> str:
+    # Both values come from MIGRATION_FILE_PATTERN, so they need no quoting
+    return f"INSERT INTO schema_migrations (version, name) VALUES ('{version}', '{name}');"
+
+
+async def applied_versions(connection: asyncpg.Connection) -> set:
+    if not await connection.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL"):
+        return set()
+    return {row["version"] for row in await connection.fetch("SELECT version FROM schema_migrations")}
+
+
+async def apply_migrations(connection: asyncpg.Connection, directory: str=MIGRATIONS_DIR,
+                           baseline: str=None) -> list:
+    """
+    Apply the pending migrations, or with baseline record every migration up to that version
+    as applied without running it.
+
+    Returns:
+        List[str]: file names of the migrations applied or recorded.
+    """
+    await connection.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await connection.execute(SCHEMA_MIGRATIONS_TABLE)
+        applied = await applied_versions(connection)
+        done = []
+        for version, name in migration_files(directory):
+            if version in applied or (baseline is not None and int(version) > int(baseline)):
+                continue
+            if baseline is not None:
+                script = record_statement(version, name)
+            else:
+                with open(os.path.join(directory, name)) as migration:
+                    # Without explicit BEGIN/COMMIT, one multi-statement query is one transaction
+                    script = f"{migration.read()}\n;\n{record_statement(version, name)}"
+            await connection.execute(script)
+            done.append(name)
+        return done
+    finally:
+        await connection.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def pending_migrations(connection) -> list:
+    """File names of the migrations not applied yet, read through an SQLAlchemy connection."""
+    exists = (await connection.execute(text("SELECT to_regclass('schema_migrations') IS NOT NULL"))).scalar()
+    applied = set()
+    if exists:
+        applied = set((await connection.execute(text("SELECT version FROM schema_migrations"))).scalars())
+    return [name for version, name in migration_files() if version not in applied]
+
+
+async def connect(engine) -> asyncpg.Connection:
+    """A plain asyncpg connection to the engine's database, outside the pool and its transactions."""
+    return await asyncpg.connect(engine.url.set(drivername="postgresql").render_as_string(hide_password=False))
+
+
+async def migrate_database(engine, baseline: str=None) -> list:
+    """apply_migrations on a connection of its own."""
+    connection = await connect(engine)
+    try:
+        return await apply_migrations(connection, baseline=baseline)
+    finally:
+        await connection.close()
+
+
+async def main(list_only: bool, baseline: str):
+    from database.database import engine
+
+    if list_only:
+        connection = await connect(engine)
+        try:
+            applied = await applied_versions(connection)
+        finally:
+            await connection.close()
+        for version, name in migration_files():
+            print(f"{'applied' if version in applied else 'pending'}  {name}")
+        return
+    done = await migrate_database(engine, baseline)
+    print(f"{'Recorded' if baseline else 'Applied'} {len(done)} migrations" + "".join(f"\n  {name}" for name in done))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the SQL migrations in database/migrations")
+    parser.add_argument("--list", action="store_true", help="show applied and pending migrations")
+    parser.add_argument("--baseline", help="record migrations up to this version as applied without running them")
+    args = parser.parse_args()
+    asyncio.run(main(args.list, args.baseline))
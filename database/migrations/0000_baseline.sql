@@ -0,0 +1,24 @@
+-- Schema the migrations below start from, as the first release created it
+CREATE TABLE IF NOT EXISTS author (
+    id SERIAL NOT NULL PRIMARY KEY,
+    name VARCHAR NOT NULL,
+    birth_date VARCHAR NOT NULL,
+    CONSTRAINT unique_name_birth_date UNIQUE (name, birth_date)
+);
+
+CREATE TABLE IF NOT EXISTS book (
+    id SERIAL NOT NULL PRIMARY KEY,
+    title VARCHAR NOT NULL,
+    publish_year INTEGER NOT NULL,
+    author_id INTEGER REFERENCES author (id),
+    barcode VARCHAR NOT NULL UNIQUE,
+    CONSTRAINT unique_title_publish_year UNIQUE (title, publish_year)
+);
+CREATE INDEX IF NOT EXISTS idx_barcode ON book (barcode);
+
+CREATE TABLE IF NOT EXISTS inventory (
+    id SERIAL NOT NULL PRIMARY KEY,
+    book_id INTEGER NOT NULL REFERENCES book (id),
+    quantity INTEGER NOT NULL,
+    date VARCHAR NOT NULL
+);
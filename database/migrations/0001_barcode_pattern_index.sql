@@ -0,0 +1,4 @@
+-- Replace the plain barcode btree, which LIKE prefix searches cannot use under non-C
+-- collations, with a "C" collation expression index used by GET /book?barcode=
+DROP INDEX IF EXISTS idx_barcode;
+CREATE INDEX IF NOT EXISTS idx_barcode_pattern ON book ((barcode COLLATE "C"));
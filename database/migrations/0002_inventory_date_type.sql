@@ -0,0 +1,4 @@
+-- Store inventory dates as DATE instead of YYYY-MM-DD strings and index the ledger by
+-- (book_id, date) so history windows and per-book reads are index range scans
+ALTER TABLE inventory ALTER COLUMN date TYPE DATE USING CAST(date AS DATE);
+CREATE INDEX IF NOT EXISTS idx_inventory_book_id_date ON inventory (book_id, date);
@@ -0,0 +1,22 @@
+-- Per-book, per-day rollup of the inventory ledger used for /history balances,
+-- built from the existing ledger (same as python -m database.daily_balance)
+CREATE TABLE IF NOT EXISTS inventory_daily_balance (
+    book_id INTEGER NOT NULL REFERENCES book (id),
+    day DATE NOT NULL,
+    net_quantity INTEGER NOT NULL,
+    closing_balance INTEGER NOT NULL,
+    PRIMARY KEY (book_id, day)
+);
+
+BEGIN;
+LOCK TABLE inventory IN SHARE MODE;
+DELETE FROM inventory_daily_balance;
+INSERT INTO inventory_daily_balance (book_id, day, net_quantity, closing_balance)
+SELECT
+    book_id,
+    date,
+    SUM(quantity),
+    SUM(SUM(quantity)) OVER (PARTITION BY book_id ORDER BY date)
+FROM inventory
+GROUP BY book_id, date;
+COMMIT;
@@ -0,0 +1,13 @@
+-- Status of POST /leftover/bulk?job=true imports, readable from every worker
+CREATE TABLE IF NOT EXISTS bulk_job (
+    id VARCHAR NOT NULL PRIMARY KEY,
+    file_name VARCHAR NOT NULL,
+    status VARCHAR NOT NULL,
+    rows_parsed INTEGER NOT NULL,
+    rows_ingested INTEGER NOT NULL,
+    error VARCHAR,
+    error_status INTEGER,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    started_at TIMESTAMP WITHOUT TIME ZONE,
+    finished_at TIMESTAMP WITHOUT TIME ZONE
+);
@@ -0,0 +1,13 @@
+-- Per-book stock balance maintained with every inventory insert, built from the ledger for
+-- books that have no balance row yet (same as python -m database.stock_balance --rebuild
+-- on a database without the table)
+CREATE TABLE IF NOT EXISTS stock_balance (
+    book_id INTEGER NOT NULL PRIMARY KEY REFERENCES book (id),
+    quantity INTEGER NOT NULL
+);
+
+INSERT INTO stock_balance (book_id, quantity)
+SELECT book_id, SUM(quantity)
+FROM inventory
+GROUP BY book_id
+ON CONFLICT (book_id) DO NOTHING;
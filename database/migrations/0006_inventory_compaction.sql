@@ -0,0 +1,12 @@
+-- Ledger compaction (python -m database.compaction): movements older than the horizon are
+-- folded into one opening row per book and period and moved to inventory_archive
+ALTER TABLE inventory ADD COLUMN IF NOT EXISTS opening BOOLEAN NOT NULL DEFAULT false;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_inventory_opening ON inventory (book_id, date) WHERE opening;
+
+CREATE TABLE IF NOT EXISTS inventory_archive (
+    id INTEGER NOT NULL PRIMARY KEY,
+    book_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    date DATE NOT NULL,
+    archived_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
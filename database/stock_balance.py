@@ -0,0 +1,120 @@
+"""
+Maintained per-book stock balance.
+
+`stock_balance` holds SUM(inventory.quantity) for every book so that point reads and the
+remove check don't aggregate the whole ledger. It is updated in the same transaction as
+every `inventory` insert through `apply_stock_movements`, or through `reserve_stock` for single
+removals, which only succeed while enough copies are in stock.
+
+Check or rebuild it from the ledger:
+
+    python -m database.stock_balance            # report mismatching books
+    python -m database.stock_balance --rebuild  # recompute every balance from inventory
+"""
+import argparse
+import asyncio
+from typing import Optional
+
+from sqlalchemy import text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import StockBalance
+
+
+async def apply_stock_movements(session: AsyncSession, movements: dict) -> None:
+    """
+    Add the net quantity of each book to its balance row, creating missing rows.
+    The caller owns the transaction and commits it together with the inventory rows.
+
+    Args:
+        movements (Dict[int, int]): book id -> net quantity change.
+    """
+    if not movements:
+        return
+    statement = insert(StockBalance).values(
+        [{"book_id": book_id, "quantity": quantity} for book_id, quantity in sorted(movements.items())]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[StockBalance.book_id],
+        set_={"quantity": StockBalance.quantity + statement.excluded.quantity},
+    )
+    await session.exec(statement)
+
+
+async def reserve_stock(session: AsyncSession, book_id: int, quantity: int) -> Optional[int]:
+    """
+    Take quantity copies of a book off its balance if that many are in stock.
+
+    The check and the decrement are one conditional UPDATE: concurrent removals of the same
+    book wait on its balance row lock and re-check the committed quantity, so stock never goes
+    negative, while removals of other books are not blocked. The caller owns the transaction.
+
+    Returns:
+        Optional[int]: the remaining balance, or None if there was not enough stock.
+    """
+    statement = (
+        update(StockBalance)
+        .where(StockBalance.book_id == book_id, StockBalance.quantity >= quantity)
+        .values(quantity=StockBalance.quantity - quantity)
+        .returning(StockBalance.quantity)
+    )
+    return (await session.exec(statement)).scalar_one_or_none()
+
+
+async def check_stock_balance(session: AsyncSession) -> list:
+    """Return every book whose maintained balance differs from its ledger sum."""
+    query = """
+    SELECT
+        COALESCE(ledger.book_id, sb.book_id) AS book_id,
+        COALESCE(ledger.quantity, 0) AS ledger_quantity,
+        COALESCE(sb.quantity, 0) AS balance_quantity
+    FROM (
+        SELECT book_id, SUM(quantity) AS quantity
+        FROM inventory
+        GROUP BY book_id
+    ) ledger
+    FULL OUTER JOIN stock_balance sb ON sb.book_id = ledger.book_id
+    WHERE COALESCE(ledger.quantity, 0) <> COALESCE(sb.quantity, 0)
+    ORDER BY 1;
+    """
+    result = await session.exec(text(query))
+    return [dict(row._mapping) for row in result.fetchall()]
+
+
+async def rebuild_stock_balance(session: AsyncSession) -> int:
+    """Recompute every balance from the ledger and return the number of balance rows."""
+    # Block concurrent inventory writes so the rebuilt balances match the ledger
+    await session.exec(text("LOCK TABLE inventory IN SHARE MODE"))
+    await session.exec(text("DELETE FROM stock_balance"))
+    result = await session.exec(text("""
+    INSERT INTO stock_balance (book_id, quantity)
+    SELECT book_id, SUM(quantity)
+    FROM inventory
+    GROUP BY book_id
+    """))
+    await session.commit()
+    return result.rowcount
+
+
+async def main(rebuild: bool):
+    from database.database import async_session, engine
+
+    async with async_session() as session:
+        if rebuild:
+            count = await rebuild_stock_balance(session)
+            print(f"Rebuilt stock balance for {count} books")
+        else:
+            mismatches = await check_stock_balance(session)
+            for mismatch in mismatches:
+                print(mismatch)
+            print(f"{len(mismatches)} books with inconsistent stock balance")
+    await engine.dispose()
+    return 0 if rebuild or not mismatches else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or rebuild the stock_balance table from the inventory ledger")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every balance from the ledger")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.rebuild)))
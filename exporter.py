@@ -6,4 +6,59 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+# seconds to wait for a pooled connection before failing the request
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+# test connections with a round trip on checkout, for servers that drop idle connections
+DATABASE_POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "false").lower() == "true"
+# replace pooled connections older than this many seconds, -1 keeps them forever
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", "-1"))
+# read replica for GET /author/{id}, /book/{id}, /book and /history, disabled when empty; it
+# holds DATABASE_NAME and gets a pool of its own with the settings above. After a write, the
+# client's reads go to the primary for this many seconds, so it sees what it wrote
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+DATABASE_READ_YOUR_WRITES_SECONDS = int(os.getenv("DATABASE_READ_YOUR_WRITES_SECONDS", "5"))
+# /leftover/bulk uploads larger than this are ingested through PostgreSQL COPY
+BULK_COPY_THRESHOLD_BYTES = int(os.getenv("BULK_COPY_THRESHOLD_BYTES", str(64 * 1024 * 1024)))
+# POST /leftover/bulk?job=true: spool directory (system temp directory when empty), parser
+# processes (CPU count when 0), bytes of BRC/QNT or .csv parsed by one process at a time,
+# and jobs ingested at once
+BULK_JOB_DIR = os.getenv("BULK_JOB_DIR", "")
+BULK_JOB_WORKERS = int(os.getenv("BULK_JOB_WORKERS", "0"))
+BULK_JOB_RANGE_BYTES = int(os.getenv("BULK_JOB_RANGE_BYTES", str(4 * 1024 * 1024)))
+BULK_JOB_CONCURRENCY = int(os.getenv("BULK_JOB_CONCURRENCY", "2"))
+# /leftover/add and /leftover/remove calls arriving within this many milliseconds are written
+# by one transaction, at most INVENTORY_GROUP_COMMIT_MAX_BATCH of them; 0 commits each call on its own
+INVENTORY_GROUP_COMMIT_WINDOW_MS = float(os.getenv("INVENTORY_GROUP_COMMIT_WINDOW_MS", "0"))
+INVENTORY_GROUP_COMMIT_MAX_BATCH = int(os.getenv("INVENTORY_GROUP_COMMIT_MAX_BATCH", "500"))
+# python -m database.compaction: movements dated more than this many days ago are folded into
+# one opening row per book per period (day, week, month, quarter or year) and archived, for
+# this many books per transaction
+INVENTORY_COMPACTION_HORIZON_DAYS = int(os.getenv("INVENTORY_COMPACTION_HORIZON_DAYS", "365"))
+INVENTORY_COMPACTION_PERIOD = os.getenv("INVENTORY_COMPACTION_PERIOD", "month")
+INVENTORY_COMPACTION_BATCH_BOOKS = int(os.getenv("INVENTORY_COMPACTION_BATCH_BOOKS", "1000"))
+# python serve.py: worker processes (CPU count when 0), event loop and HTTP parser ("auto"
+# uses uvloop and httptools when installed), import the app once before forking, and
+# seconds a draining worker waits for in-flight requests
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))
+SERVER_LOOP = os.getenv("SERVER_LOOP", "auto")
+SERVER_HTTP = os.getenv("SERVER_HTTP", "auto")
+SERVER_PRELOAD = os.getenv("SERVER_PRELOAD", "true").lower() == "true"
+SERVER_GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+# in-process author/book cache
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+# PostgreSQL NOTIFY channel for cross-worker cache invalidation, disabled when empty
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "")
+# logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# per-route sampling of request/result logs, e.g. "/book=0.01,/history=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "2000"))
+LOG_MAX_FIELD_ITEMS = int(os.getenv("LOG_MAX_FIELD_ITEMS", "10"))
+# SQL statement logging: "false", "true" (statements) or "debug" (statements and rows)
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower()
 FIXTURE_PATH_FOR_UNIT_TEST = os.getenv("FIXTURE_PATH_FOR_UNIT_TEST")
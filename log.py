@@ -0,0 +1,131 @@
+"""
+Logging setup for the bookshop service.
+
+Records go through a QueueHandler to a background QueueListener, so request handlers never
+block on log output. log_event() writes structured key=value records: it returns before
+touching its fields when the level is disabled or the route is not sampled, and caps
+every field so large payloads can't dominate a request.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+import orjson
+
+from exporter import DATABASE_ECHO, LOG_LEVEL, LOG_SAMPLE_RATES, LOG_MAX_FIELD_LENGTH, LOG_MAX_FIELD_ITEMS
+
+
+def parse_sample_rates(value: str) -> dict:
+    """Parse "/book=0.01,/history=0.1" into {"/book": 0.01, "/history": 0.1}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, rate = item.rsplit("=", 1)
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+sample_rates = parse_sample_rates(LOG_SAMPLE_RATES)
+
+# DATABASE_ECHO -> level of the sqlalchemy.engine logger
+SQL_LOG_LEVELS = {
+    "false": logging.WARNING,
+    "true": logging.INFO,
+    "debug": logging.DEBUG,
+}
+
+
+def _json_default(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+def format_field(value) -> str:
+    """Render a field value as at most LOG_MAX_FIELD_LENGTH characters."""
+    if isinstance(value, (list, tuple)) and len(value) > LOG_MAX_FIELD_ITEMS:
+        value = {"count": len(value), "head": value[:LOG_MAX_FIELD_ITEMS]}
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+    if not isinstance(value, str):
+        value = orjson.dumps(value, default=_json_default).decode()
+    if len(value) > LOG_MAX_FIELD_LENGTH:
+        value = value[:LOG_MAX_FIELD_LENGTH] + "...(truncated)"
+    if not value or any(character.isspace() for character in value):
+        value = '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return value
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Formats records as ts=... level=... logger=... msg=... followed by their fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        # Tracebacks are appended to the message by QueueHandler; keep them on their own lines
+        message, _, details = record.getMessage().partition("\n")
+        if record.exc_info:
+            details = self.formatException(record.exc_info)
+        fields = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": message,
+        }
+        fields.update(getattr(record, "fields", {}))
+        line = " ".join(f"{key}={format_field(value)}" for key, value in fields.items())
+        return f"{line}\n{details}" if details else line
+
+
+_listener = None
+
+
+def start_log_listener(handler: logging.Handler):
+    """Route root records through a new queue to handler, written by a new listener thread."""
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    logging.getLogger().handlers = [logging.handlers.QueueHandler(log_queue)]
+
+
+def stop_log_listener():
+    """Write the queued records and stop the listener thread."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def setup_logging() -> logging.Logger:
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(KeyValueFormatter())
+    start_log_listener(stream_handler)
+    atexit.register(stop_log_listener)
+    # A forked worker has no listener thread; give it its own queue and thread
+    os.register_at_fork(after_in_child=lambda: start_log_listener(stream_handler))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    # SQL statements go through the same queue instead of create_engine(echo=...)'s own handler
+    logging.getLogger("sqlalchemy.engine").setLevel(SQL_LOG_LEVELS.get(DATABASE_ECHO, logging.WARNING))
+    return logging.getLogger("bookshop")
+
+
+def is_sampled(route: str) -> bool:
+    rate = sample_rates.get(route, 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+def log_event(logger: logging.Logger, level: int, message: str, route: str=None, **fields):
+    """
+    Log a structured record, sampled per route.
+
+    Fields are passed as objects and only rendered by the listener thread, so nothing is
+    formatted when the level is disabled or the record is not sampled.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if route is not None:
+        if not is_sampled(route):
+            return
+        fields = {"route": route, **fields}
+    logger.log(level, message, extra={"fields": fields})
@@ -2,23 +2,46 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from asyncio import Event
 
 from api.router import router
-from database.database import create_db_and_tables
+from api.handlers import inventory_queue, bulk_jobs
+from database.cache_invalidation import CacheInvalidationListener
+from database.database import engine, job_engine, job_session, replica_engine, unit_of_work, ReadYourWritesMiddleware
+from database.migrate import pending_migrations
+from exporter import CACHE_INVALIDATION_CHANNEL, INVENTORY_GROUP_COMMIT_WINDOW_MS
+from metrics import MetricsMiddleware
 from api.handlers import *
 from models import *
+from responses import ORJSONResponse
 from utils import logger
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables()
-    logger.info("Database migration completed successfully.")
+    # The schema is migrated once per rollout by python -m database.migrate, not by every worker
+    async with engine.connect() as connection:
+        pending = await pending_migrations(connection)
+    if pending:
+        logger.warning(f"Database schema is behind, run python -m database.migrate to apply {', '.join(pending)}")
+    cache_invalidation_listener = None
+    if CACHE_INVALIDATION_CHANNEL:
+        cache_invalidation_listener = CacheInvalidationListener(engine, CACHE_INVALIDATION_CHANNEL)
+        await cache_invalidation_listener.start()
+    if INVENTORY_GROUP_COMMIT_WINDOW_MS > 0:
+        await inventory_queue.start(unit_of_work)
+    await bulk_jobs.start(lambda: unit_of_work(job_session))
     yield
-    shutdown_event.set()
-
-app = FastAPI(lifespan=lifespan)
+    await bulk_jobs.stop()
+    # Write the inventory movements still queued before the pool is disposed
+    await inventory_queue.stop()
+    if cache_invalidation_listener is not None:
+        await cache_invalidation_listener.stop()
+    await engine.dispose()
+    await job_engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,14 +50,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(router)
 
-shutdown_event = Event()
-
-
-async def graceful_shutdown():
-    await shutdown_event.wait()
-
 
 if __name__ == "__main__":
     import uvicorn
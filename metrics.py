@@ -0,0 +1,241 @@
+"""
+Prometheus metrics for the bookshop service.
+
+MetricsMiddleware records request latency and status codes per route, and
+instrument_engine() hooks SQLAlchemy engine and pool events for query timings and
+connection pool usage, so handlers don't have to report anything themselves.
+Metrics are per process and rendered in the Prometheus text format at /metrics.
+"""
+import contextvars
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, labels: tuple=(), amount: float=1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose values are read from callbacks when metrics are rendered."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.callbacks = {}
+
+    def set_function(self, labels: tuple, callback):
+        self.callbacks[labels] = callback
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels in sorted(self.callbacks):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {self.callbacks[labels]()}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple=(), buckets: tuple=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket_labels = format_labels((*self.labelnames, "le"), (*labels, str(bound)))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+http_requests_total = Counter("http_requests_total", "HTTP requests by route and status code",
+                              ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency",
+                                          ("method", "route"))
+http_request_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL statements per request",
+                                    ("method", "route"))
+db_query_duration_seconds = Histogram("db_query_duration_seconds", "SQL statement latency by statement type",
+                                      ("statement",))
+http_request_db_checkouts = Histogram("http_request_db_checkouts", "Pooled connections checked out per request",
+                                      ("method", "route"), buckets=(0, 1, 2, 3, 5, 10))
+db_pool_checkout_wait_seconds = Histogram("db_pool_checkout_wait_seconds",
+                                          "Time spent waiting for a pooled connection")
+bulk_upload_rows_total = Counter("bulk_upload_rows_total", "Inventory rows written by /leftover/bulk")
+bulk_upload_bytes_total = Counter("bulk_upload_bytes_total", "Bytes uploaded to /leftover/bulk")
+bulk_upload_seconds_total = Counter("bulk_upload_seconds_total", "Time spent handling /leftover/bulk")
+bulk_upload_rows_per_second = Histogram("bulk_upload_rows_per_second", "Rows per second of each bulk upload",
+                                        buckets=(100, 1000, 10000, 50000, 100000, 250000, 500000, 1000000))
+bulk_upload_bytes_per_second = Histogram("bulk_upload_bytes_per_second", "Bytes per second of each bulk upload",
+                                         buckets=(1e4, 1e5, 1e6, 1e7, 5e7, 1e8, 5e8))
+group_commit_batch_size = Histogram("group_commit_batch_size", "Requests written per group commit",
+                                    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+db_pool_connections_in_use = Gauge("db_pool_connections_in_use", "Pooled connections checked out", ("pool",))
+db_pool_connections_idle = Gauge("db_pool_connections_idle", "Pooled connections available", ("pool",))
+db_pool_overflow = Gauge("db_pool_overflow", "Connections open above the pool size", ("pool",))
+
+metrics = [http_requests_total, http_request_duration_seconds, http_request_db_seconds, http_request_db_checkouts,
+           db_query_duration_seconds, db_pool_checkout_wait_seconds, bulk_upload_rows_total,
+           bulk_upload_bytes_total, bulk_upload_seconds_total, bulk_upload_rows_per_second,
+           bulk_upload_bytes_per_second, group_commit_batch_size, db_pool_connections_in_use,
+           db_pool_connections_idle, db_pool_overflow]
+
+BULK_UPLOAD_ROUTE = "/leftover/bulk"
+
+
+class RequestStats:
+    """SQL activity of the current request, filled in by the engine hooks."""
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.checkouts = 0
+        self.inventory_rows = 0
+
+
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MeasuredQueuePool(AsyncAdaptedQueuePool):
+    """Connection pool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait_seconds.observe((), time.perf_counter() - started)
+
+
+def instrument_engine(engine, pool_name: str="primary"):
+    """Register query timing hooks and pool gauges, labelled pool=pool_name, on an AsyncEngine."""
+    sync_engine = engine.sync_engine
+    pool = sync_engine.pool
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info["query_started"].pop()
+        statement_type = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        db_query_duration_seconds.observe((statement_type,), elapsed)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.db_seconds += elapsed
+            if statement_type == "INSERT" and "INTO inventory " in statement:
+                # asyncpg reports no rowcount for executemany, which runs once per parameter set
+                rows = len(parameters) if executemany else cursor.rowcount
+                stats.inventory_rows += max(rows, 0)
+
+    @event.listens_for(sync_engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        stats = request_stats.get()
+        if stats is not None:
+            stats.checkouts += 1
+
+    # Read through the engine, since dispose() replaces its pool
+    if hasattr(pool, "checkedout"):
+        db_pool_connections_in_use.set_function((pool_name,), lambda: sync_engine.pool.checkedout())
+        db_pool_connections_idle.set_function((pool_name,), lambda: sync_engine.pool.checkedin())
+        db_pool_overflow.set_function((pool_name,), lambda: sync_engine.pool.overflow())
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status code and SQL time of every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = None
+
+    def get_route(self, scope) -> str:
+        if self.route_paths is None:
+            self.route_paths = {route.endpoint: route.path for route in scope["app"].routes
+                                if hasattr(route, "endpoint")}
+        return self.route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_stats.reset(token)
+            method = scope["method"]
+            route = self.get_route(scope)
+            http_requests_total.inc((method, route, str(status[0])))
+            http_request_duration_seconds.observe((method, route), elapsed)
+            http_request_db_seconds.observe((method, route), stats.db_seconds)
+            http_request_db_checkouts.observe((method, route), stats.checkouts)
+            if route == BULK_UPLOAD_ROUTE and status[0] < 400:
+                self.record_bulk_upload(scope, stats, elapsed)
+
+    @staticmethod
+    def record_bulk_upload(scope, stats: RequestStats, elapsed: float):
+        headers = dict(scope["headers"])
+        size = int(headers.get(b"content-length", 0))
+        bulk_upload_rows_total.inc((), stats.inventory_rows)
+        bulk_upload_bytes_total.inc((), size)
+        bulk_upload_seconds_total.inc((), elapsed)
+        if elapsed > 0:
+            bulk_upload_rows_per_second.observe((), stats.inventory_rows / elapsed)
+            bulk_upload_bytes_per_second.observe((), size / elapsed)
@@ -1,6 +1,6 @@
 from typing import Optional
-from datetime import datetime
-from sqlalchemy import Index
+from datetime import date, datetime
+from sqlalchemy import Index, text
 
 from sqlmodel import SQLModel, Field, UniqueConstraint, Column, Integer
 from sqlalchemy import ForeignKey
@@ -44,7 +44,6 @@ class Author(SQLModel, table=True):
 class Book(SQLModel, table=True):
     __table_args__ = (
         UniqueConstraint("title", "publish_year", name="unique_title_publish_year"),
-        Index('idx_barcode', 'barcode')  # Add this line to create an index on barcode
     )
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
@@ -57,19 +56,66 @@ class Book(SQLModel, table=True):
             raise ValidityError("publish_year must be greater than 1900")
 
 
+# "C" collation index so barcode prefix ranges and keyset pages are index scans
+# whatever the database collation is
+Index("idx_barcode_pattern", Book.barcode.collate("C"))
+
+
 class Inventory(SQLModel, table=True):
+    __table_args__ = (
+        Index("idx_inventory_book_id_date", "book_id", "date"),
+        Index("idx_inventory_opening", "book_id", "date", unique=True, postgresql_where=text("opening")),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     book_id: int = Field(foreign_key="book.id")
     quantity: int
-    date: str
+    date: date
+    # Net movement of a compacted period, see database.compaction
+    opening: bool = Field(default=False, sa_column_kwargs={"server_default": text("false")})
 
     def check_request_validity(self):
         if self.quantity <= 0:
             raise ValidityError("quantity must be greater than 0")
-        try:
-            datetime.strptime(self.date, "%Y-%m-%d")
-        except ValueError:
-            raise ValidityError("Invalid date format. Date must be in YYYY-MM-DD format")
+        if not isinstance(self.date, date):
+            raise ValidityError("Invalid date. Date must be a calendar date")
+
+
+class InventoryArchive(SQLModel, table=True):
+    __tablename__ = "inventory_archive"
+    id: int = Field(sa_column=Column(Integer, primary_key=True, autoincrement=False))
+    book_id: int
+    quantity: int
+    date: date
+    archived_at: datetime
+
+
+class StockBalance(SQLModel, table=True):
+    __tablename__ = "stock_balance"
+    book_id: int = Field(foreign_key="book.id", primary_key=True)
+    quantity: int = 0
+
+
+class InventoryDailyBalance(SQLModel, table=True):
+    __tablename__ = "inventory_daily_balance"
+    book_id: int = Field(foreign_key="book.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    net_quantity: int = 0
+    closing_balance: int = 0
+
+
+class BulkJob(SQLModel, table=True):
+    __tablename__ = "bulk_job"
+    id: str = Field(primary_key=True)
+    file_name: str
+    # queued, running, succeeded or failed
+    status: str = "queued"
+    rows_parsed: int = 0
+    rows_ingested: int = 0
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
 
 class InventoryRequest(SQLModel):
@@ -85,6 +131,8 @@ class InventoryHistoryRequest(SQLModel):
     start: str
     end: str
     book: Optional[str]
+    after_book: Optional[int] = None
+    limit: Optional[int] = None
 
     def check_request_validity(self):
         try:
@@ -94,3 +142,5 @@ class InventoryHistoryRequest(SQLModel):
                 raise ValidityError("end must be later than start")
         except ValueError:
             raise ValidityError("Invalid date format. Date must be in YYYY-MM-DD format")
+        if self.book is not None and not self.book.isdigit():
+            raise ValidityError("book must be a book id")
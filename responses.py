@@ -1,9 +1,34 @@
+from typing import Any, TypedDict
+
+import orjson
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+from pydantic import BaseModel
+
 from constants import RESP_DATA, RESP_STATUS, RESP_MESSAGE
 
 
-def Response(data: object, message: str) -> object:
-    return {
+def encode_model(obj: Any) -> Any:
+    """orjson fallback for objects it can't serialize natively."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(_ORJSONResponse):
+    """Serializes the content with orjson in one pass, without jsonable_encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=encode_model,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+ResponsePayload = TypedDict("ResponsePayload", {RESP_DATA: Any, RESP_STATUS: bool, RESP_MESSAGE: str})
+
+
+def Response(data: object, message: str, status_code: int=200) -> ORJSONResponse:
+    payload: ResponsePayload = {
         RESP_DATA: data,
         RESP_STATUS: True,
         RESP_MESSAGE: message,
     }
+    return ORJSONResponse(content=payload, status_code=status_code)
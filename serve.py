@@ -0,0 +1,139 @@
+"""
+Production server: pre-forked uvicorn workers sharing one listening socket.
+
+    python serve.py --workers 4 --port 8000
+
+The master binds the socket, imports the application once (SERVER_PRELOAD) and forks the
+workers, which share the imported modules copy-on-write. Every worker replaces the connection
+pool it inherited with its own, then runs the lifespan (group commit queue, cache invalidation
+listener, bulk job runner) and serves requests on its own event loop, with uvloop and
+httptools when they are installed.
+
+SIGTERM or SIGINT drains the server. The master forwards SIGTERM to every worker. Each worker
+stops accepting connections and finishes its in-flight requests within SERVER_GRACEFUL_TIMEOUT
+seconds. It then runs the lifespan shutdown, which writes the queued inventory movements before
+closing the pool. Workers still running 5 seconds after that are killed. A worker that exits on
+its own is replaced.
+"""
+import argparse
+import os
+import signal
+import sys
+import time
+
+import uvicorn
+
+from exporter import (SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_LOOP, SERVER_HTTP, SERVER_PRELOAD,
+                      SERVER_GRACEFUL_TIMEOUT)
+from log import stop_log_listener
+from utils import logger
+
+# A worker exiting sooner than this after it started is replaced after this delay, so a
+# worker that cannot boot does not fork in a tight loop
+MIN_WORKER_LIFETIME = 1.0
+KILL_GRACE_SECONDS = 5
+
+
+def run_worker(config: uvicorn.Config, sock) -> int:
+    from database.database import engine, replica_engine
+
+    # Connections the master may have opened must not be shared between processes; the
+    # worker opens its own on first use
+    engine.sync_engine.dispose(close=False)
+    if replica_engine is not None:
+        replica_engine.sync_engine.dispose(close=False)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    return 0 if server.started else 1
+
+
+class Master:
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.sock = None
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        # Worker: uvicorn installs its own SIGTERM/SIGINT handlers
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGALRM):
+            signal.signal(sig, signal.SIG_DFL)
+        code = 1
+        try:
+            code = run_worker(self.config, self.sock)
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} failed")
+        finally:
+            stop_log_listener()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def drain(self, sig, frame):
+        if not self.stopping:
+            logger.info(f"Received {signal.Signals(sig).name}, draining {len(self.children)} workers")
+            self.stopping = True
+            signal.alarm(int(SERVER_GRACEFUL_TIMEOUT) + KILL_GRACE_SECONDS)
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+
+    def kill(self, sig, frame):
+        for pid in self.children:
+            logger.error(f"Worker {pid} did not drain in time, killing it")
+            os.kill(pid, signal.SIGKILL)
+
+    def run(self) -> int:
+        self.sock = self.config.bind_socket()
+        signal.signal(signal.SIGTERM, self.drain)
+        signal.signal(signal.SIGINT, self.drain)
+        signal.signal(signal.SIGALRM, self.kill)
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info(f"Serving with {self.workers} workers")
+
+        failed = False
+        while self.children:
+            pid, status = os.wait()
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                failed = failed or code != 0
+                continue
+            logger.error(f"Worker {pid} exited with {code}, starting a new one")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            self.spawn()
+        self.sock.close()
+        logger.info("All workers stopped")
+        return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the bookshop API with pre-forked uvicorn workers")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS or os.cpu_count())
+    parser.add_argument("--loop", default=SERVER_LOOP, choices=["auto", "asyncio", "uvloop"])
+    parser.add_argument("--http", default=SERVER_HTTP, choices=["auto", "h11", "httptools"])
+    parser.add_argument("--no-preload", dest="preload", action="store_false", default=SERVER_PRELOAD,
+                        help="import the app in every worker instead of once in the master")
+    args = parser.parse_args()
+
+    if args.preload:
+        from main import app
+    else:
+        app = "main:app"
+    config = uvicorn.Config(app, host=args.host, port=args.port, loop=args.loop, http=args.http, lifespan="on",
+                            timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT)
+    raise SystemExit(Master(config, args.workers).run())
+
+
+if __name__ == "__main__":
+    main()
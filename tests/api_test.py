@@ -1,33 +1,80 @@
+import asyncio
+from datetime import date
+import io
+import json
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel import SQLModel, create_engine
+from sqlalchemy import inspect
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
 import logging
+import concurrent.futures
 import os
-
-from database.database import get_session
+import signal
+import socket
+import subprocess
+import sys
+import time
+import httpx
+
+from cache import author_cache, book_cache
+from database.database import get_session, get_read_session, get_bulk_upload_session, get_async_database_url, unit_of_work
+from database.compaction import compact_inventory
+from database.daily_balance import backfill_daily_balance
+from database.stock_balance import check_stock_balance, rebuild_stock_balance
 from exporter import DATABASE_URL
 from main import app
+from api import handlers
+from api.handlers import add_inventory_handler, add_inventory_batch_handler, add_inventory_bulk_handler, add_inventory_copy_handler, insert_inventories
+from database.group_commit import GroupCommitQueue
+from database.migrate import migrate_database, apply_migrations, connect
+from bulk_jobs import BulkJobRunner
+from fastapi import UploadFile
+from metrics import bulk_upload_rows_total, group_commit_batch_size
+from models import InventoryRequest
+from metrics import instrument_engine
 from exporter import FIXTURE_PATH_FOR_UNIT_TEST
 
 logger = logging.getLogger('test')
 
 
-@pytest.fixture(name="session")
-def session_fixture():
+@pytest.fixture(name="async_engine")
+def async_engine_fixture():
     test_engine = create_engine(DATABASE_URL+"test_bookshop", echo=True)
     SQLModel.metadata.drop_all(test_engine)
     SQLModel.metadata.create_all(test_engine)
+    test_engine.dispose()
 
-    with Session(test_engine) as session:
-        yield session
+    # TestClient runs every request on a fresh event loop, so pooled
+    # asyncpg connections cannot be shared between requests.
+    engine = create_async_engine(get_async_database_url(DATABASE_URL)+"test_bookshop",
+                                 echo=True, poolclass=NullPool)
+    instrument_engine(engine)
+    yield engine
 
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
-    def get_session_override():
-        return session
+def client_fixture(async_engine):
+    async def get_session_override():
+        async with unit_of_work(lambda: AsyncSession(async_engine, expire_on_commit=False)) as session:
+            yield session
+
+    async def get_bulk_upload_session_override(job: bool=False):
+        if job:
+            yield None
+            return
+        async for session in get_session_override():
+            yield session
 
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_read_session] = get_session_override
+    app.dependency_overrides[get_bulk_upload_session] = get_bulk_upload_session_override
+    # Every test starts from an empty database
+    author_cache.clear()
+    book_cache.clear()
 
     client = TestClient(app)
     yield client
@@ -41,7 +88,46 @@ def test_ping(client):
     assert response.json() == {"data": "ping", "status": True, "message": "ping"}
 
 
-def test_success_cases(client):
+def test_bulk_only_packages_are_not_imported_at_startup():
+    imported = subprocess.run([sys.executable, "-c", "import sys, main; print(*sorted({'pandas', 'numpy', 'openpyxl'} & set(sys.modules)))"],
+                              capture_output=True, text=True, check=True).stdout.split()
+    assert imported == []
+
+
+def test_metrics(client):
+    client.get("/ping")
+    client.get("/author/999999")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/ping",status="200"}' in response.text
+    assert 'http_requests_total{method="GET",route="/author/{author_id}",status="404"}' in response.text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/ping",le="+Inf"}' in response.text
+    assert 'db_pool_connections_in_use{pool="primary"}' in response.text
+
+
+def test_one_connection_per_request(client):
+    # GET /author/{id} then POST /book: a read and a write through the unit of work
+    author = client.post("/author", json={"name": "checkout author", "birth_date": "1963-11-10"}).json()["data"]
+    client.get(f"/author/{author['id']}")
+    client.post("/book", json={"title": "checkout book", "publish_year": 2000, "author": author["id"],
+                               "barcode": "777"})
+    metrics = client.get("/metrics").text
+
+    for route in ('method="POST",route="/author"', 'method="GET",route="/author/{author_id}"',
+                  'method="POST",route="/book"'):
+        one = next(line for line in metrics.splitlines()
+                   if line.startswith(f'http_request_db_checkouts_bucket{{{route},le="1"}}'))
+        total = next(line for line in metrics.splitlines()
+                     if line.startswith(f'http_request_db_checkouts_bucket{{{route},le="+Inf"}}'))
+        zero = next(line for line in metrics.splitlines()
+                    if line.startswith(f'http_request_db_checkouts_bucket{{{route},le="0"}}'))
+        assert one.split()[-1] == total.split()[-1]
+        assert zero.split()[-1] == "0"
+
+
+def test_success_cases(client, async_engine):
     # POST /author
     author_data = [
         {"name": "test author", "birth_date": "1963-11-10"},
@@ -65,6 +151,11 @@ def test_success_cases(client):
         "id": author_ids[0]
     }
 
+    # GET /author/{author_id} is served from the cache the second time
+    hits = author_cache.hits
+    assert client.get(f"/author/{author_ids[0]}").json() == get_author_response.json()
+    assert author_cache.hits == hits + 1
+
     # POST /book
     book_data = [
         {"barcode": "1111238", "title": "test book", "publish_year": 1990, "author": author_ids[0]},
@@ -109,26 +200,464 @@ def test_success_cases(client):
     file_paths = [os.path.abspath(FIXTURE_PATH_FOR_UNIT_TEST+"txt_example.txt"), os.path.abspath(FIXTURE_PATH_FOR_UNIT_TEST+"xls_example_correct.xlsx")]
     for file_path in file_paths:
         file_data = {'file': open(file_path, 'rb')}
+        rows_before = bulk_upload_rows_total.values.get((), 0)
         bulk_response = client.post("/leftover/bulk", files=file_data)
         assert bulk_response.status_code == 201
-        assert len(bulk_response.json()["data"]) == 3
+        assert bulk_response.json()["data"]["rows"] == 3
+        assert bulk_upload_rows_total.values[()] == rows_before + 3
+
+    # POST /leftover/bulk?copy=true
+    file_data = {'file': open(os.path.abspath(FIXTURE_PATH_FOR_UNIT_TEST+"txt_example.txt"), 'rb')}
+    rows_before = bulk_upload_rows_total.values.get((), 0)
+    bulk_response = client.post("/leftover/bulk?copy=true", files=file_data)
+    assert bulk_response.status_code == 201
+    assert bulk_upload_rows_total.values[()] == rows_before + 3
+    # Only totals per book come back, whatever the size of the file
+    assert bulk_response.json()["data"] == {"rows": 3, "books": [
+        {"book_id": book_ids[3], "barcode": "15110", "rows": 1, "quantity": 2},
+        {"book_id": book_ids[4], "barcode": "15002", "rows": 1, "quantity": -3},
+        {"book_id": book_ids[5], "barcode": "14810", "rows": 1, "quantity": 3}]}
 
     # GET /book/{book_id}
     get_book_response = client.get(f"/book/{book_ids[0]}")
     assert get_book_response.status_code == 200
     assert get_book_response.json()["data"]["quantity"] == 5
+    assert client.get("/cache/stats").json()["data"]["book"]["hits"] == 1
 
     # GET /book?barcode=?
     get_book_response2 = client.get("/book?barcode=11112")
     assert get_book_response2.status_code == 200
     assert get_book_response2.json()["data"]["found"] == 2
 
+    # GET /book?barcode=?&limit=?&after_barcode=?
+    first_page = client.get("/book?barcode=11112&limit=1").json()["data"]
+    assert [item["barcode"] for item in first_page["items"]] == ["1111234"]
+    assert first_page["next_after_barcode"] == "1111234"
+    second_page = client.get(f"/book?barcode=11112&limit=1&after_barcode={first_page['next_after_barcode']}").json()["data"]
+    assert [item["barcode"] for item in second_page["items"]] == ["1111238"]
+
     # GET /history
     get_history_response = client.get(f"/history?book={book_ids[0]}")
     assert get_history_response.status_code == 200
     assert len(get_history_response.json()["data"][0]["history"]) == 3
     assert get_history_response.json()["data"][0]["end_balance"] == 5
 
+    # GET /history?limit=?&after_book=?
+    assert [data["book"]["key"] for data in client.get("/history").json()["data"]] == book_ids
+    first_page = client.get("/history?limit=2").json()["data"]
+    assert [data["book"]["key"] for data in first_page["items"]] == book_ids[:2]
+    assert first_page["next_after_book"] == book_ids[1]
+    second_page = client.get(f"/history?limit=2&after_book={first_page['next_after_book']}").json()["data"]
+    assert [data["book"]["key"] for data in second_page["items"]] == book_ids[2:4]
+    last_page = client.get(f"/history?limit={len(book_ids)}&after_book={book_ids[1]}").json()["data"]
+    assert last_page["found"] == len(book_ids) - 2 and last_page["next_after_book"] is None
+
+    # GET /history?format=ndjson
+    stream_response = client.get(f"/history?format=ndjson&after_book={book_ids[3]}")
+    assert stream_response.status_code == 200
+    assert [json.loads(line)["book"]["key"] for line in stream_response.text.splitlines()] == book_ids[4:]
+    # Bad parameters and database errors still get a status code, not a truncated 200 stream
+    assert client.get("/history?format=ndjson&book=x").status_code == 422
+    query = handlers.BOOK_HISTORY_QUERY
+    handlers.BOOK_HISTORY_QUERY = "SELECT 1 / 0"
+    try:
+        assert client.get("/history?format=ndjson").status_code == 500
+    finally:
+        handlers.BOOK_HISTORY_QUERY = query
+
+    # stock_balance matches the inventory ledger, before and after a rebuild
+    async def check_and_rebuild():
+        async with AsyncSession(async_engine) as session:
+            mismatches = await check_stock_balance(session)
+            await rebuild_stock_balance(session)
+            return mismatches, await check_stock_balance(session)
+    assert asyncio.run(check_and_rebuild()) == ([], [])
+
+    # inventory_daily_balance maintained on writes matches a backfill from the ledger
+    async def daily_balance_before_and_after_backfill():
+        query = text("SELECT * FROM inventory_daily_balance ORDER BY book_id, day")
+        async with AsyncSession(async_engine) as session:
+            maintained = (await session.exec(query)).fetchall()
+            await backfill_daily_balance(session)
+            return maintained, (await session.exec(query)).fetchall()
+    maintained, backfilled = asyncio.run(daily_balance_before_and_after_backfill())
+    assert maintained == backfilled
+    assert len(maintained) == 6
+
+
+def test_concurrent_remove_never_oversells(client, async_engine):
+    author = client.post("/author", json={"name": "hot author", "birth_date": "1963-11-10"}).json()["data"]
+    book = client.post("/book", json={"title": "hot book", "publish_year": 2000, "author": author["id"],
+                                      "barcode": "424242"}).json()["data"]
+    client.post("/leftover/add", json={"barcode": "424242", "quantity": 5})
+
+    # 20 concurrent single-copy sales, each in its own unit of work and connection
+    async def sell():
+        try:
+            async with unit_of_work(lambda: AsyncSession(async_engine, expire_on_commit=False)) as session:
+                await add_inventory_handler(session, InventoryRequest(barcode="424242", quantity=-1))
+            return True
+        except ValueError:
+            return False
+
+    async def sell_concurrently():
+        return await asyncio.gather(*(sell() for _ in range(20)))
+    assert sum(asyncio.run(sell_concurrently())) == 5
+
+    response = client.get(f"/book/{book['id']}")
+    assert response.json()["data"]["quantity"] == 0
+
+
+def test_concurrent_overlapping_bulk_uploads(client, async_engine):
+    author = client.post("/author", json={"name": "bulk author", "birth_date": "1963-11-10"}).json()["data"]
+    book_ids = [client.post("/book", json={"title": f"bulk book {barcode}", "publish_year": 2000, "author": author["id"],
+                                           "barcode": barcode}).json()["data"]["id"] for barcode in ("515151", "525252")]
+
+    # Two uploads of the same books in opposite batch order, each reading its second batch
+    # only once both wrote their first one
+    async def upload_concurrently():
+        first_batches_written = asyncio.Barrier(2)
+
+        async def batches(barcodes):
+            yield [(0, int(barcodes[0]), 1)]
+            await first_batches_written.wait()
+            yield [(1, int(barcodes[1]), 2)]
+
+        async def upload(barcodes):
+            async with unit_of_work(lambda: AsyncSession(async_engine, expire_on_commit=False)) as session:
+                return await add_inventory_bulk_handler(session, batches(barcodes))
+
+        return await asyncio.gather(upload(("515151", "525252")), upload(("525252", "515151")))
+    assert [result["rows"] for result in asyncio.run(upload_concurrently())] == [2, 2]
+
+    assert [client.get(f"/book/{book_id}").json()["data"]["quantity"] for book_id in book_ids] == [3, 3]
+
+
+def test_group_commit(client, async_engine, monkeypatch):
+    author = client.post("/author", json={"name": "queued author", "birth_date": "1963-11-10"}).json()["data"]
+    book = client.post("/book", json={"title": "queued book", "publish_year": 2000, "author": author["id"],
+                                      "barcode": "515151"}).json()["data"]
+    client.post("/leftover/add", json={"barcode": "515151", "quantity": 3})
+    queue = GroupCommitQueue(add_inventory_batch_handler, 0.05, 100)
+    monkeypatch.setattr(handlers, "inventory_queue", queue)
+
+    async def submit_burst():
+        await queue.start(lambda: unit_of_work(lambda: AsyncSession(async_engine, expire_on_commit=False)))
+        requests = [InventoryRequest(barcode="515151", quantity=-1) for _ in range(5)]
+        requests += [InventoryRequest(barcode="000000", quantity=1), InventoryRequest(barcode="515151", quantity=2)]
+        results = await asyncio.gather(*(add_inventory_handler(None, request) for request in requests),
+                                       return_exceptions=True)
+        await queue.stop()
+        return results
+
+    def batches():
+        return sum(sum(counts) for counts, _ in group_commit_batch_size.values.values())
+
+    batches_before = batches()
+    results = asyncio.run(submit_burst())
+    # One transaction for the whole burst; each caller gets its own outcome in arrival order
+    assert batches() == batches_before + 1
+    assert [isinstance(result, dict) for result in results] == [True, True, True, False, False, False, True]
+    assert "No enough" in str(results[3]) and "Empty book" in str(results[5])
+    assert client.get(f"/book/{book['id']}").json()["data"]["quantity"] == 2
+
+
+def test_bulk_job(client, async_engine, tmp_path):
+    author = client.post("/author", json={"name": "job author", "birth_date": "1963-11-10"}).json()["data"]
+    book_ids = []
+    for number, barcode in enumerate(["15110", "15002", "14810"]):
+        book_ids.append(client.post("/book", json={"title": f"job book {number}", "publish_year": 2000,
+                                                   "author": author["id"], "barcode": barcode}).json()["data"]["id"])
+    # The server's runner is only started by the lifespan
+    response = client.post("/leftover/bulk?job=true", files={"file": ("stock.csv", b"15110,1\n")})
+    assert response.status_code == 503
+
+    runner = BulkJobRunner(str(tmp_path), 2, 16, 1)
+
+    async def run_jobs():
+        await runner.start(lambda: unit_of_work(lambda: AsyncSession(async_engine, expire_on_commit=False)))
+        with open(FIXTURE_PATH_FOR_UNIT_TEST+"txt_example.txt", "rb") as file:
+            text_job = await runner.submit(UploadFile(file, filename="txt_example.txt"), add_inventory_bulk_handler)
+            await runner.wait()
+        failing_job = await runner.submit(UploadFile(io.BytesIO(b"15110,1\n15002,2\n14810,a\n"), filename="fail.csv"),
+                                          add_inventory_copy_handler)
+        await runner.wait()
+        stopped_job = await runner.submit(UploadFile(io.BytesIO(b"15110,1\n"), filename="stopped.csv"),
+                                          add_inventory_bulk_handler)
+        await runner.stop()
+        return text_job, failing_job, stopped_job
+
+    text_job, failing_job, stopped_job = asyncio.run(run_jobs())
+    assert text_job["status"] == "queued"
+    assert os.listdir(tmp_path) == []
+
+    response = client.get(f"/leftover/bulk/{text_job['id']}")
+    assert response.status_code == 200
+    job = response.json()["data"]
+    assert (job["status"], job["rows_parsed"], job["rows_ingested"], job["error"]) == ("succeeded", 3, 3, None)
+    assert job["rows_per_second"] > 0
+    assert [client.get(f"/book/{book_id}").json()["data"]["quantity"] for book_id in book_ids] == [2, -3, 3]
+
+    # Same validation as a synchronous upload, and nothing written
+    job = client.get(f"/leftover/bulk/{failing_job['id']}").json()["data"]
+    assert (job["status"], job["error_status"]) == ("failed", 400)
+    assert "quantity is not a number a in row 2" in job["error"]
+    assert client.get(f"/book/{book_ids[0]}").json()["data"]["quantity"] == 2
+
+    # Jobs still running at shutdown roll back
+    job = client.get(f"/leftover/bulk/{stopped_job['id']}").json()["data"]
+    assert (job["status"], job["error_status"]) == ("failed", 503)
+    assert client.get(f"/book/{book_ids[0]}").json()["data"]["quantity"] == 2
+
+    assert client.get("/leftover/bulk/unknown").status_code == 404
+
+
+def test_serve_drains_in_flight_writes(client):
+    author = client.post("/author", json={"name": "drain author", "birth_date": "1963-11-10"}).json()["data"]
+    book = client.post("/book", json={"title": "drain book", "publish_year": 2000, "author": author["id"],
+                                      "barcode": "616161"}).json()["data"]
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    # Group commit holds the write for a second, so it is still queued when the drain starts
+    env = {**os.environ, "DATABASE_NAME": "test_bookshop", "INVENTORY_GROUP_COMMIT_WINDOW_MS": "1000"}
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", "2", "--host", "127.0.0.1", "--port", str(port)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/ping")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            response = executor.submit(httpx.post, f"http://127.0.0.1:{port}/leftover/add",
+                                       json={"barcode": "616161", "quantity": 4}, timeout=30)
+            time.sleep(0.3)
+            server.send_signal(signal.SIGTERM)
+            assert response.result().status_code == 201
+        assert server.wait(timeout=30) == 0
+    finally:
+        server.kill()
+    assert client.get(f"/book/{book['id']}").json()["data"]["quantity"] == 4
+
+
+def test_migrations(async_engine, tmp_path):
+    test_engine = create_engine(DATABASE_URL+"test_bookshop")
+    SQLModel.metadata.drop_all(test_engine)
+    with test_engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS schema_migrations, migration_a, migration_b"))
+
+    async def run_migrations(directory=None):
+        if directory is None:
+            return await migrate_database(async_engine)
+        connection = await connect(async_engine)
+        try:
+            return await apply_migrations(connection, str(directory))
+        finally:
+            await connection.close()
+
+    # The migrations build the schema the models describe, and only once
+    assert len(asyncio.run(run_migrations())) == len(os.listdir("database/migrations"))
+    assert asyncio.run(run_migrations()) == []
+    inspector = inspect(test_engine)
+    for table in SQLModel.metadata.sorted_tables:
+        columns = {column["name"]: column["nullable"] for column in inspector.get_columns(table.name)}
+        assert columns == {column.name: column.nullable for column in table.columns}
+        indexes = {index["name"] for index in inspector.get_indexes(table.name) if "duplicates_constraint" not in index}
+        assert indexes == {index.name for index in table.indexes}
+
+    # A failing migration leaves nothing behind and is not recorded
+    with test_engine.begin() as connection:
+        connection.execute(text("DROP TABLE schema_migrations"))
+    (tmp_path / "0001_create_a.sql").write_text("CREATE TABLE migration_a (id INTEGER);")
+    (tmp_path / "0002_create_b.sql").write_text("CREATE TABLE migration_b (id INTEGER);\nSELECT 1 / 0;")
+    with pytest.raises(Exception, match="division by zero"):
+        asyncio.run(run_migrations(tmp_path))
+    inspector = inspect(test_engine)
+    assert inspector.has_table("migration_a") and not inspector.has_table("migration_b")
+    with test_engine.begin() as connection:
+        assert list(connection.execute(text("SELECT name FROM schema_migrations")).scalars()) == ["0001_create_a.sql"]
+        connection.execute(text("DROP TABLE schema_migrations, migration_a"))
+    test_engine.dispose()
+
+
+def test_read_replica(client, async_engine, monkeypatch):
+    # The replica is a second database with the schema and none of the primary's writes,
+    # like a replica lagging behind
+    admin_engine = create_engine(DATABASE_URL+"postgres", isolation_level="AUTOCOMMIT")
+    with admin_engine.connect() as connection:
+        if connection.execute(text("SELECT 1 FROM pg_database WHERE datname = 'test_bookshop_replica'")).first() is None:
+            connection.execute(text("CREATE DATABASE test_bookshop_replica"))
+    admin_engine.dispose()
+    replica_sync_engine = create_engine(DATABASE_URL+"test_bookshop_replica")
+    SQLModel.metadata.drop_all(replica_sync_engine)
+    SQLModel.metadata.create_all(replica_sync_engine)
+    replica_engine = create_async_engine(get_async_database_url(DATABASE_URL)+"test_bookshop_replica",
+                                         poolclass=NullPool, execution_options={"postgresql_readonly": True})
+    monkeypatch.setattr("database.database.async_session",
+                        lambda: AsyncSession(async_engine, expire_on_commit=False))
+    monkeypatch.setattr("database.database.replica_session",
+                        lambda: AsyncSession(replica_engine, expire_on_commit=False))
+    del app.dependency_overrides[get_read_session]
+
+    response = client.post("/author", json={"name": "replica author", "birth_date": "1963-11-10"})
+    assert response.status_code == 201
+    assert "read_your_writes" in response.cookies
+    author_id = response.json()["data"]["id"]
+
+    # Without the cookie or the header reads go to the replica, which has not seen the write
+    client.cookies.clear()
+    assert client.get(f"/author/{author_id}").status_code == 404
+    assert client.get(f"/book?ids={author_id}").json()["data"]["missing"] == [author_id]
+    assert client.get(f"/author/{author_id}", headers={"X-Read-Your-Writes": "true"}).status_code == 200
+    author_cache.clear()
+    client.cookies.set("read_your_writes", "1")
+    assert client.get(f"/author/{author_id}").status_code == 200
+    author_cache.clear()
+    client.cookies.clear()
+    with replica_sync_engine.begin() as connection:
+        connection.execute(text("INSERT INTO author (id, name, birth_date) VALUES (:id, 'replica author', '1963-11-10')"),
+                           {"id": author_id})
+    assert client.get(f"/author/{author_id}").json()["data"]["name"] == "replica author"
+
+    # Replica transactions are read only
+    async def write_to_replica():
+        async with unit_of_work(lambda: AsyncSession(replica_engine)) as session:
+            await session.exec(text("DELETE FROM author"))
+
+    with pytest.raises(Exception, match="read-only transaction"):
+        asyncio.run(write_to_replica())
+    replica_sync_engine.dispose()
+
+
+def test_inventory_compaction(client, async_engine):
+    author_id = client.post("/author", json={"name": "ledger author", "birth_date": "1950-01-01"}).json()["data"]["id"]
+    book_ids = [client.post("/book", json={"title": f"ledger book {number}", "publish_year": 2000, "author": author_id,
+                                           "barcode": f"55500{number}"}).json()["data"]["id"]
+                for number in range(3)]
+    days = [date(2024, 1, 5), date(2024, 1, 20), date(2024, 2, 1), date(2024, 3, 31), date(2024, 4, 1),
+            date(2024, 4, 14), date(2024, 4, 15), date(2024, 5, 2), date(2024, 6, 30)]
+    rows = [{"book_id": book_id, "quantity": quantity, "date": day}
+            for book_id in book_ids[:2] for day, quantity in zip(days, (10, -2, 5, -1, 7, -3, 4, -2, 6))]
+    horizon = date(2024, 4, 15)
+
+    def run(call):
+        async def with_session():
+            async with unit_of_work(lambda: AsyncSession(async_engine, expire_on_commit=False)) as session:
+                return await call(session)
+        return asyncio.run(with_session())
+
+    def compact(batch_books=1):
+        return asyncio.run(compact_inventory(lambda: unit_of_work(lambda: AsyncSession(async_engine, expire_on_commit=False)),
+                                             horizon, "month", batch_books))
+
+    def snapshot():
+        return ([client.get(f"/book/{book_id}").json()["data"]["quantity"] for book_id in book_ids],
+                client.get("/history?start=2024-04-15&end=2024-06-30").json()["data"],
+                client.get("/history?start=2024-05-01&end=2024-05-31").json()["data"],
+                run(lambda session: check_stock_balance(session)))
+
+    def daily_balance():
+        return run(lambda session: session.exec(text("SELECT * FROM inventory_daily_balance ORDER BY 1, 2"))).all()
+
+    run(lambda session: insert_inventories(session, rows))
+    before = snapshot()
+    assert before[0] == [24, 24, 0] and before[3] == []
+
+    # Stock and history from the horizon on are unchanged, older movements become one row per month
+    assert compact() == {"books": 2, "archived": 12, "opening": 8}
+    assert snapshot() == before
+    ledger = run(lambda session: session.exec(text(
+        "SELECT date, quantity, opening FROM inventory WHERE book_id = :book_id ORDER BY date"),
+        params={"book_id": book_ids[0]})).all()
+    assert [tuple(row) for row in ledger] == [
+        (date(2024, 1, 1), 8, True), (date(2024, 2, 1), 5, True), (date(2024, 3, 1), -1, True),
+        (date(2024, 4, 1), 4, True), (date(2024, 4, 15), 4, False), (date(2024, 5, 2), -2, False),
+        (date(2024, 6, 30), 6, False)]
+    archived = run(lambda session: session.exec(text("SELECT COUNT(*) FROM inventory_archive"))).scalar()
+    assert archived == 12
+    # The rollup is the one the compacted ledger rebuilds
+    compacted = daily_balance()
+    run(lambda session: backfill_daily_balance(session))
+    assert daily_balance() == compacted
+
+    # A movement backdated past the horizon is added to its period's opening row by the next run
+    run(lambda session: insert_inventories(session, [{"book_id": book_ids[0], "quantity": 3, "date": date(2024, 2, 10)}]))
+    backdated = snapshot()
+    assert backdated[0] == [27, 24, 0] and backdated[1][0]["start_balance"] == before[1][0]["start_balance"] + 3
+    assert compact(batch_books=10) == {"books": 2, "archived": 1, "opening": 1}
+    assert snapshot() == backdated
+    assert compact() == {"books": 2, "archived": 0, "opening": 0}
+
+
+def test_batch_endpoints(client):
+    response = client.post("/author/batch", json=[
+        {"name": "batch author", "birth_date": "1963-11-10"},
+        {"name": "batch author 2", "birth_date": "1800-01-01"},
+        {"name": "batch author", "birth_date": "1963-11-10"},
+    ])
+    assert response.status_code == 201
+    authors = response.json()["data"]
+    assert [sorted(author) for author in authors] == [["id", "index"], ["error", "index"], ["error", "index"]]
+    author_id = authors[0]["id"]
+
+    response = client.post("/author/batch", json=[{"name": "batch author", "birth_date": "1963-11-10"}])
+    assert "error" in response.json()["data"][0]
+
+    response = client.post("/book/batch", json=[
+        {"title": "batch book", "publish_year": 2000, "author": author_id, "barcode": "900001"},
+        {"title": "batch book 2", "publish_year": 2001, "author": author_id, "barcode": "900002"},
+        {"title": "batch book 3", "publish_year": 1800, "author": author_id, "barcode": "900003"},
+        {"title": "batch book 4", "publish_year": 2002, "author": 999999, "barcode": "900004"},
+    ])
+    assert response.status_code == 201
+    books = response.json()["data"]
+    assert ["id" in book for book in books] == [True, True, False, False]
+    assert client.get(f"/book/{books[1]['id']}").json()["data"]["barcode"] == "900002"
+
+    response = client.post("/leftover/batch", json=[
+        {"barcode": "900001", "quantity": 5},
+        {"barcode": "900002", "quantity": 0},
+        {"barcode": "999999", "quantity": 1},
+        {"barcode": "900001", "quantity": 2},
+    ])
+    assert response.status_code == 201
+    movements = response.json()["data"]
+    assert ["error" in movement for movement in movements] == [False, True, True, False]
+    assert movements[3]["id"] > movements[0]["id"]
+    assert [movements[index]["quantity"] for index in (0, 3)] == [5, 2]
+    assert client.get(f"/book/{books[0]['id']}").json()["data"]["quantity"] == 7
+
+    # Empty and oversized batches are rejected before reaching the database
+    assert client.post("/leftover/batch", json=[]).status_code == 422
+    assert client.post("/leftover/batch", json=[{"barcode": "900001", "quantity": 1}] * 1001).status_code == 422
+
+
+def test_book_multi_get(client):
+    author = client.post("/author", json={"name": "cart author", "birth_date": "1963-11-10"}).json()["data"]
+    books = client.post("/book/batch", json=[
+        {"title": f"cart book {number}", "publish_year": 2000, "author": author["id"], "barcode": f"80000{number}"}
+        for number in range(3)
+    ]).json()["data"]
+    client.post("/leftover/add", json={"barcode": "800001", "quantity": 4})
+    first, second, third = (book["id"] for book in books)
+
+    response = client.get(f"/book?ids={third},999999,{second},{first}")
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert [item["id"] for item in data["items"]] == [third, second, first]
+    assert [item["quantity"] for item in data["items"]] == [0, 4, 0]
+    assert data["missing"] == [999999]
+
+    data = client.get("/book?barcodes=800001,123,800000").json()["data"]
+    assert [item["barcode"] for item in data["items"]] == ["800001", "800000"]
+    assert data["missing"] == ["123"]
+
+    assert client.get("/book?ids=1,x").status_code == 422
+    assert client.get("/book?ids=1&barcode=8").status_code == 422
+    assert client.get("/book").status_code == 422
+
 
 def test_failure_cases(client):
     # Method not allowed
@@ -151,6 +680,9 @@ def test_failure_cases(client):
     file_data = {'file': open(os.path.abspath(FIXTURE_PATH_FOR_UNIT_TEST+"xls_example_fail.xlsx"), 'rb')}
     bulk_response = client.post("/leftover/bulk", files=file_data)
     assert bulk_response.status_code == 500
+    file_data = {'file': open(os.path.abspath(FIXTURE_PATH_FOR_UNIT_TEST+"xls_example_fail.xlsx"), 'rb')}
+    bulk_response = client.post("/leftover/bulk?copy=true", files=file_data)
+    assert bulk_response.status_code == 500
 
     # Bad request - if quantity not a number - error 400 (task requirement)
     response = client.post("/author", json={"name": "test author", "birth_date": "1963-11-10"},)
@@ -165,3 +697,22 @@ def test_failure_cases(client):
     file_data = {'file': open(FIXTURE_PATH_FOR_UNIT_TEST+"xls_example_fail.xlsx", 'rb')}
     bulk_response = client.post("/leftover/bulk", files=file_data)
     assert bulk_response.status_code == 400
+    file_data = {'file': open(FIXTURE_PATH_FOR_UNIT_TEST+"xls_example_fail.xlsx", 'rb')}
+    bulk_response = client.post("/leftover/bulk?copy=true", files=file_data)
+    assert bulk_response.status_code == 400
+
+    # .csv follows the same rules as .xlsx
+    for copy in ("false", "true"):
+        bulk_response = client.post(f"/leftover/bulk?copy={copy}",
+                                    files={"file": ("fail.csv", b"1111234,2\n1111238,-2\n11245,a\n")})
+        assert bulk_response.status_code == 400
+        bulk_response = client.post(f"/leftover/bulk?copy={copy}",
+                                    files={"file": ("correct.csv", b"1111234,2\r\n,\r\n1111238,-2\r\n11245,4\r\n")})
+        assert bulk_response.status_code == 201
+        summary = bulk_response.json()["data"]
+        assert summary["rows"] == 3
+        assert {book["barcode"]: book["quantity"] for book in summary["books"]} == {"1111234": 2, "1111238": -2, "11245": 4}
+
+    # Unsupported file type
+    bulk_response = client.post("/leftover/bulk", files={"file": ("stock.json", b"[]")})
+    assert bulk_response.status_code == 400
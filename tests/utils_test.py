@@ -0,0 +1,71 @@
+import asyncio
+import io
+import os
+
+from exporter import FIXTURE_PATH_FOR_UNIT_TEST
+from utils import (BarcodeQuantityParser, iter_barcode_quantity_batches, iter_csv_rows, iter_row_batches, iter_xlsx_rows,
+                   split_file_ranges, parse_barcode_quantity_range, parse_csv_range)
+
+
+class ChunkedUpload:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    async def read(self, size):
+        chunk = self.data[self.position:self.position + size]
+        self.position += size
+        return chunk
+
+
+def test_parser_keeps_state_across_chunks():
+    data = b"FLN15\nBRC15110\r\nQNT2\nITN2\nBRC15002\nQNT-3\nBRC14810\nQNT3"
+    for chunk_size in range(1, len(data) + 1):
+        parser = BarcodeQuantityParser()
+        pairs = []
+        for start in range(0, len(data), chunk_size):
+            pairs.extend(parser.feed(data[start:start + chunk_size]))
+        pairs.extend(parser.close())
+        assert pairs == [(15110, 2), (15002, -3), (14810, 3)]
+
+
+def test_batches_from_upload_stream():
+    data = b"".join(b"BRC%d\nQNT%d\n" % (i, i) for i in range(10))
+
+    async def collect():
+        return [batch async for batch in iter_barcode_quantity_batches(ChunkedUpload(data), batch_size=4, chunk_size=7)]
+
+    batches = asyncio.run(collect())
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert batches[2] == [(8, 8, 8), (9, 9, 9)]
+
+
+def test_xlsx_rows_are_streamed_typed():
+    with open(os.path.join(FIXTURE_PATH_FOR_UNIT_TEST, "xls_example_fail.xlsx"), "rb") as file:
+        assert list(iter_xlsx_rows(file)) == [(1111234, 2), (1111238, -2), (11245, "a")]
+
+
+def test_csv_rows_and_batches():
+    data = io.BytesIO(b"1111234,2\n1111238, -2.5\n11245\n,\n11246,a\n")
+    assert list(iter_csv_rows(data)) == [(1111234, 2), (1111238, -2.5), (11245, None), (None, None), (11246, "a")]
+
+    async def collect():
+        return [batch async for batch in iter_row_batches(iter([(1, 1)] * 5), batch_size=2)]
+
+    assert asyncio.run(collect()) == [[(0, 1, 1), (1, 1, 1)], [(2, 1, 1), (3, 1, 1)], [(4, 1, 1)]]
+
+
+def test_file_ranges_parse_like_one_pass(tmp_path):
+    text_path = tmp_path / "stock.txt"
+    text_path.write_bytes(b"FLN15\nBRC15110\nQNT2\nITN2\nBRC15002\nBRC15003\nQNT-3\n  BRC14810\nQNT3\nBRC1\nQNT1")
+    ranges = split_file_ranges(text_path, 8, b"BRC")
+    assert len(ranges) > 1
+    pairs = [pair for start, end in ranges for pair in parse_barcode_quantity_range(text_path, start, end)]
+    assert pairs == [(15110, 2), (15003, -3), (14810, 3), (1, 1)]
+
+    csv_path = tmp_path / "stock.csv"
+    csv_path.write_bytes(b"15110,2\r\n,\r\n15002,-3\r\n14810,a\r\n1,1")
+    ranges = split_file_ranges(csv_path, 5)
+    assert len(ranges) > 1
+    rows = [row for start, end in ranges for row in parse_csv_range(csv_path, start, end)]
+    assert rows == list(iter_csv_rows(io.BytesIO(csv_path.read_bytes())))
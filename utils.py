@@ -1,9 +1,222 @@
-import logging
-import pandas as pd
-from constants import BARCODE_PREFIX, QUANTITY_PREFIX
+import asyncio
+import csv
+import io
+import itertools
+import os
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("bookshop")
+from constants import BARCODE_PREFIX, QUANTITY_PREFIX, BULK_BATCH_SIZE, BULK_CHUNK_SIZE
+from log import setup_logging
+
+logger = setup_logging()
+
+
+class BarcodeQuantityParser:
+    """
+    Incremental BRC/QNT parser.
+
+    Bytes are fed in arbitrary chunks; a line split across two chunks and a BRC line whose
+    QNT arrives in a later chunk are both carried over, so only one partial line is ever
+    held in memory.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._brc_line = None
+
+    def _parse_line(self, raw_line):
+        line = raw_line.decode().strip()
+        if line.startswith(BARCODE_PREFIX):
+            self._brc_line = line
+        elif line.startswith(QUANTITY_PREFIX) and self._brc_line:
+            pair = (int(self._brc_line.replace(BARCODE_PREFIX, "")),
+                    int(line.replace(QUANTITY_PREFIX, "")))
+            self._brc_line = None
+            return pair
+        return None
+
+    def feed(self, chunk):
+        """
+        Parses a chunk of bytes.
+
+        Args:
+            chunk (bytes): The next part of the BRC/QNT data.
+
+        Yields:
+            Tuple[int, int]: (barcode, quantity) pairs completed by this chunk.
+        """
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()
+        for raw_line in lines:
+            pair = self._parse_line(raw_line)
+            if pair is not None:
+                yield pair
+
+    def close(self):
+        """Parses the last line, which has no trailing newline."""
+        raw_line, self._buffer = self._buffer, b""
+        pair = self._parse_line(raw_line)
+        if pair is not None:
+            yield pair
+
+
+async def iter_barcode_quantity_batches(file, batch_size=BULK_BATCH_SIZE, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Reads BRC/QNT data from an upload stream in chunks.
+
+    Args:
+        file (UploadFile): The uploaded text file.
+        batch_size (int): Number of pairs per yielded batch.
+        chunk_size (int): Number of bytes read from the stream at a time.
+
+    Yields:
+        List[Tuple[int, int, int]]: Batches of (row index, barcode, quantity).
+    """
+    parser = BarcodeQuantityParser()
+    batch = []
+    index = 0
+    while True:
+        chunk = await file.read(chunk_size)
+        pairs = parser.feed(chunk) if chunk else parser.close()
+        for barcode, quantity in pairs:
+            batch.append((index, barcode, quantity))
+            index += 1
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if not chunk:
+            break
+    if batch:
+        yield batch
+
+
+def iter_xlsx_rows(file):
+    """
+    Streams (barcode, quantity) rows from the first sheet of an .xlsx file.
+
+    The workbook is opened read-only, so rows are parsed from the sheet XML as they are
+    iterated instead of building the whole workbook in memory. Cells keep the types
+    openpyxl gives them (int, float, str or None).
+
+    Args:
+        file: A seekable binary file object.
+
+    Yields:
+        Tuple[object, object]: (barcode, quantity) of every row, empty rows included.
+    """
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # Some writers store wrong sheet dimensions, which read-only mode would trust
+        sheet.reset_dimensions()
+        for row in sheet.iter_rows(max_col=2, values_only=True):
+            yield (*row, None, None)[:2]
+    finally:
+        workbook.close()
+
+
+def parse_csv_number(value: str):
+    """Returns the int or float a CSV field holds, None for an empty field, or the text itself."""
+    value = value.strip()
+    if not value:
+        return None
+    for number_type in (int, float):
+        try:
+            return number_type(value)
+        except ValueError:
+            pass
+    return value
+
+
+def iter_csv_rows(file, encoding="utf-8"):
+    """
+    Streams (barcode, quantity) rows from a headerless two column .csv file.
+
+    Yields:
+        Tuple[object, object]: (barcode, quantity) of every row, typed as in iter_xlsx_rows.
+    """
+    for row in csv.reader(io.TextIOWrapper(file, encoding=encoding, newline="")):
+        barcode, quantity = (*row, "", "")[:2]
+        yield parse_csv_number(barcode), parse_csv_number(quantity)
+
+
+async def iter_row_batches(rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Groups (barcode, quantity) rows into ingestion batches.
+
+    Each batch is read in a worker thread, since parsing a spreadsheet is CPU bound and the
+    rows come from a blocking file.
+
+    Yields:
+        List[Tuple[int, object, object]]: Batches of (row index, barcode, quantity).
+    """
+    def read_batch(start):
+        return [(index, barcode, quantity)
+                for index, (barcode, quantity) in enumerate(itertools.islice(rows, batch_size), start)]
+
+    start = 0
+    while True:
+        batch = await asyncio.to_thread(read_batch, start)
+        if not batch:
+            break
+        yield batch
+        start += len(batch)
+
+
+def split_file_ranges(path, range_bytes, line_prefix=b""):
+    """
+    Splits a file into byte ranges of about range_bytes that can be parsed independently.
+
+    Every range starts at the beginning of a line that starts with line_prefix (ignoring
+    leading whitespace), so a BRC line and its QNT line, or a .csv row, never straddle two
+    ranges. Quoted .csv fields must not span lines.
+
+    Returns:
+        List[Tuple[int, int]]: (start, end) offsets covering the whole file in order.
+    """
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, "rb") as file:
+        position = range_bytes
+        while position < size:
+            file.seek(position)
+            # Skip the rest of the line the position falls in
+            file.readline()
+            line_start = file.tell()
+            line = file.readline()
+            while line and not line.lstrip().startswith(line_prefix):
+                line_start = file.tell()
+                line = file.readline()
+            if not line:
+                break
+            starts.append(line_start)
+            position = line_start + range_bytes
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def read_file_range(path, start, end):
+    with open(path, "rb") as file:
+        file.seek(start)
+        return file.read(end - start)
+
+
+def parse_barcode_quantity_range(path, start, end):
+    """Returns the (barcode, quantity) pairs of a BRC/QNT byte range from split_file_ranges."""
+    parser = BarcodeQuantityParser()
+    data = read_file_range(path, start, end)
+    return [*parser.feed(data), *parser.close()]
+
+
+def parse_csv_range(path, start, end):
+    """Returns the (barcode, quantity) rows of a .csv byte range from split_file_ranges."""
+    return list(iter_csv_rows(io.BytesIO(read_file_range(path, start, end))))
+
+
+def parse_xlsx_file(path):
+    """Returns the (barcode, quantity) rows of an .xlsx file."""
+    with open(path, "rb") as file:
+        return list(iter_xlsx_rows(file))
 
 
 def get_barcode_quantity_datagram_from_bytes(data):
@@ -14,22 +227,13 @@ def get_barcode_quantity_datagram_from_bytes(data):
         data (bytes): The byte data containing barcode and quantity information.
 
     Returns:
-        List[Dict[str, int]]: A list of dictionaries containing barcode-quantity pairs.
+        pd.DataFrame: A DataFrame with BRC and QNT columns.
     """
-    inventory_pairs = []
-    lines = data.decode().split("\n")
-    brc_line = None
-    for line in lines:
-        line = line.strip()
-        if line.startswith(BARCODE_PREFIX):
-            brc_line = line
-        elif line.startswith(QUANTITY_PREFIX) and brc_line:
-            inventory_pairs.append({
-                BARCODE_PREFIX: int(brc_line.replace(BARCODE_PREFIX, "")),
-                QUANTITY_PREFIX: int(line.replace(QUANTITY_PREFIX, ""))
-            })
-            brc_line = None
-    return pd.DataFrame(inventory_pairs)
+    import pandas as pd
+
+    parser = BarcodeQuantityParser()
+    inventory_pairs = [*parser.feed(data), *parser.close()]
+    return pd.DataFrame(inventory_pairs, columns=[BARCODE_PREFIX, QUANTITY_PREFIX])
 
 
 def model_to_dict(model_instance):